@@ -1,28 +1,113 @@
+import functools
 import heapq
 import math
 import time
+import tracemalloc
+from contextlib import contextmanager
 
 import networkx as nx
 import scipy
+import scipy.sparse
 
+from convergence import *
+from cost_functions import *
 from network_import import *
+from results_export import *
+from step_size import *
 from utils import PathUtils
 from scipy.optimize import minimize,root,fsolve
 vot1=1
 vot2=10
 price1=0.1
 price2=0.1
+
+
+def getClassParameters() -> dict:
+    """
+    Returns the value of time and the distance price currently used for the two user classes
+    """
+    return {"vot1": vot1, "vot2": vot2, "price1": price1, "price2": price2}
+
+
+def setClassParameters(vot_1: float = None, vot_2: float = None, price_1: float = None, price_2: float = None):
+    """
+    Changes the value of time and the distance price of the two user classes.
+    Parameters left to None keep their current value.
+    """
+    global vot1, vot2, price1, price2
+    if vot_1 is not None:
+        vot1 = vot_1
+    if vot_2 is not None:
+        vot2 = vot_2
+    if price_1 is not None:
+        price1 = price_1
+    if price_2 is not None:
+        price2 = price_2
+
+
+@contextmanager
+def _memoryPhase(memoryReport: dict, phase: str):
+    """
+    Records in memoryReport[phase] the largest peak of traced memory (bytes) observed while running the phase.
+    The traced memory counts everything allocated since the tracing started and is still alive, so within one
+    tracing session the peaks of the later phases include the memory kept by the earlier ones (e.g. the network)
+    """
+    if memoryReport is None:
+        yield
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        memoryReport[phase] = max(memoryReport.get(phase, 0), tracemalloc.get_traced_memory()[1])
+
+
+def _stopMemoryTracing(function):
+    """
+    Stops at the end of every call of function the memory tracing started by its phases,
+    tracing slows down all the following allocations of the process
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        wasTracing = tracemalloc.is_tracing()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if not wasTracing and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    return wrapper
+
+
 class FlowTransportNetwork:
 
-    def __init__(self):
+    def __init__(self, precision=np.float64):
+        """
+        :param precision: Floating point type of the stored link attributes (np.float64 or np.float32),
+               the flows and costs and all the sums of the assignment stay in double precision
+        """
+        self.precision = precision
         self.linkSet = {}
+        self.linkAttributes = newLinkAttributes(0, precision)  # attribute -> array in linkSet order, see Link
         self.nodeSet = {}
 
         self.tripSet = {}
         self.zoneSet = {}
         self.originZones = {}
 
+        # Select-link and select-zone analysis, filled during the assignment
+        self.selectLinks = set()
+        self.selectZones = set()
+        self.selectLinkFlows = {}  # (link, user_class) -> sparse OD matrix of the flows using the link
+        self.selectZoneFlows = {}  # (zone, user_class) -> sparse row vector of the link flows from/to the zone
+        self._selectFlowsState = None  # link flows at the end of the assignment that computed the select flows
+
         self.networkx_graph = None
+        self._zone_index = None
+        self._link_index = None
 
     def to_networkx(self):
         if self.networkx_graph is None:
@@ -37,8 +122,64 @@ class FlowTransportNetwork:
         for link in self.linkSet.values():
             link.reset()
 
+    def select_flows_match(self) -> bool:
+        """
+        True if the stored select flows cover all the registered select links and zones
+        and were computed by the assignment that produced the current link flows
+        """
+        return (self._selectFlowsState is not None
+                and all((link, c) in self.selectLinkFlows for link in self.selectLinks for c in (1, 2))
+                and all((zone, c) in self.selectZoneFlows for zone in self.selectZones for c in (1, 2))
+                and self._selectFlowsState == self.get_flows())
+
+    def zone_index(self) -> dict:
+        """
+        Row/column of each zone in the select-link OD matrices
+        """
+        if self._zone_index is None:
+            self._zone_index = {z: i for i, z in enumerate(sorted(self.zoneSet, key=int))}
+        return self._zone_index
+
+    def link_index(self) -> dict:
+        """
+        Column of each link in the select-zone link vectors
+        """
+        if self._link_index is None:
+            self._link_index = {l: i for i, l in enumerate(self.linkSet)}
+        return self._link_index
+
+    def register_select_link(self, init_node: str, term_node: str):
+        assert (init_node, term_node) in self.linkSet
+        self.selectLinks.add((init_node, term_node))
+
+    def register_select_zone(self, zone: str):
+        assert zone in self.zoneSet
+        self.selectZones.add(zone)
+
+    def link_column(self, attribute: str) -> np.ndarray:
+        """
+        Values of a link attribute in linkSet order. The array-backed attributes are returned as stored
+        (in the precision of the network, not a copy), the others are collected in a new double precision array
+        """
+        if attribute in self.linkAttributes:
+            return self.linkAttributes[attribute]
+        return np.fromiter((getattr(link, attribute) for link in self.linkSet.values()), dtype=float,
+                           count=len(self.linkSet))
+
+    def get_flows(self) -> dict:
+        return {l: (link.flow1, link.flow2) for l, link in self.linkSet.items()}
+
+    def set_flows(self, flows: dict, scale: float = 1.0):
+        for l, (flow1, flow2) in flows.items():
+            link = self.linkSet[l]
+            link.flow1 = flow1 * scale
+            link.flow2 = flow2 * scale
+            link.flow = link.flow1 + link.flow2
+
 
 class Zone:
+    __slots__ = ("zoneId", "lat", "lon", "destList")
+
     def __init__(self, zoneId: str):
         self.zoneId = zoneId
 
@@ -51,6 +192,7 @@ class Node:
     """
     This class has attributes associated with any node
     """
+    __slots__ = ("Id", "lat", "lon", "outLinks", "inLinks", "label", "pred")
 
     def __init__(self, nodeId: str):
         self.Id = nodeId
@@ -66,10 +208,49 @@ class Node:
         self.pred = None
 
 
+def newLinkAttributes(links: int, precision=np.float64) -> dict:
+    """
+    Arrays holding the array-backed attributes of the given number of links
+    """
+    return {attribute: np.zeros(links, dtype=precision) for attribute in Link.arrayAttributes}
+
+
+def _arrayAttribute(attribute: str):
+    def get(self) -> float:
+        return float(self._attributes[attribute][self._index])
+
+    def set(self, value: float):
+        self._attributes[attribute][self._index] = value
+
+    return property(get, set)
+
+
 class Link:
     """
-    This class has attributes associated with any link
+    This class has attributes associated with any link.
+
+    The attributes that do not change during the assignment (arrayAttributes) are stored in arrays shared by all
+    the links of the network, at the position of the link in linkSet, in the precision of the network.
+    This keeps them compact and lets the costs of all the links be evaluated at once with costVector.
+    The flows and costs are plain floats, in double precision.
     """
+    arrayAttributes = ("max_capacity", "capacity", "length", "fft", "beta", "alpha", "speedLimit", "toll", "toll1",
+                       "toll2")
+
+    __slots__ = ("init_node", "term_node", "linkType", "curr_capacity_percentage", "flow", "flow1", "flow2",
+                 "cost1", "cost2", "_attributes", "_index")
+
+    max_capacity = _arrayAttribute("max_capacity")  # veh per hour
+    capacity = _arrayAttribute("capacity")
+    length = _arrayAttribute("length")  # Length
+    fft = _arrayAttribute("fft")  # Free flow travel time (min)
+    beta = _arrayAttribute("beta")
+    alpha = _arrayAttribute("alpha")
+    speedLimit = _arrayAttribute("speedLimit")
+    toll = _arrayAttribute("toll")
+    # Toll paid by each user class, in generalized cost units (the network file toll applies to both classes)
+    toll1 = _arrayAttribute("toll1")
+    toll2 = _arrayAttribute("toll2")
 
     def __init__(self,
                  init_node: str,
@@ -81,21 +262,33 @@ class Link:
                  power: float,
                  speed_limit: float,
                  toll: float,
-                 linkType
+                 linkType,
+                 attributes: dict = None,
+                 index: int = 0
                  ):
+        """
+        :param attributes: Arrays of the array-backed attributes (see newLinkAttributes) and index the position
+               of the link in them, by default the link gets arrays of its own
+        """
         self.init_node = init_node
         self.term_node = term_node
-        self.max_capacity = float(capacity)  # veh per hour
-        self.length = float(length)  # Length
-        self.fft = float(fft)  # Free flow travel time (min)
-        self.beta = float(power)
-        self.alpha = float(b)
-        self.speedLimit = float(speed_limit)
-        self.toll = float(toll)
+        self._attributes = newLinkAttributes(1) if attributes is None else attributes
+        self._index = index
+
+        self.max_capacity = capacity
+        self.length = length
+        self.fft = fft
+        self.beta = power
+        self.alpha = b
+        self.speedLimit = speed_limit
+        self.toll = toll
         self.linkType = linkType
 
+        self.toll1 = toll
+        self.toll2 = toll
+
         self.curr_capacity_percentage = 1
-        self.capacity = self.max_capacity
+        self.capacity = capacity
         self.flow = 0.0
         self.flow1 = 0.0
         self.flow2 = 0.0
@@ -123,14 +316,18 @@ class Link:
 
 
 class Demand:
+    __slots__ = ("fromZone", "toNode", "demand", "demand2")
+
     def __init__(self,
                  init_node: str,
                  term_node: str,
-                 demand: float
+                 demand: float,
+                 demand2: float = None
                  ):
         self.fromZone = init_node
         self.toNode = term_node
-        self.demand = float(demand)
+        self.demand = float(demand)  # demand of user class 1
+        self.demand2 = self.demand if demand2 is None else float(demand2)  # demand of user class 2
 
 
 def DijkstraHeap(origin, network: FlowTransportNetwork, user_class):
@@ -180,75 +377,30 @@ def DijkstraHeap(origin, network: FlowTransportNetwork, user_class):
                     network.nodeSet[newNode].pred = newPred
 
 
-def BPRcostFunction(optimal: bool,
-                    fft: float,
-                    alpha: float,
-                    flow: float,
-                    capacity: float,
-                    beta: float,
-                    length: float,
-                    maxSpeed: float
-                    ) -> float:
-    if capacity < 1e-3:
-        return np.finfo(np.float32).max
-    if optimal:
-        return fft * (1 + (alpha * math.pow((flow * 1.0 / capacity), beta)) * (beta + 1))
-    return fft * (1 + alpha * math.pow((flow * 1.0 / capacity), beta))
-
-
-def constantCostFunction(optimal: bool,
-                         fft: float,
-                         alpha: float,
-                         flow: float,
-                         capacity: float,
-                         beta: float,
-                         length: float,
-                         maxSpeed: float
-                         ) -> float:
-    if optimal:
-        return fft + flow
-    return fft
-
-
-def greenshieldsCostFunction(optimal: bool,
-                             fft: float,
-                             alpha: float,
-                             flow: float,
-                             capacity: float,
-                             beta: float,
-                             length: float,
-                             maxSpeed: float
-                             ) -> float:
-    if capacity < 1e-3:
-        return np.finfo(np.float32).max
-    if optimal:
-        return (length * (capacity ** 2)) / (maxSpeed * (capacity - flow) ** 2)
-    return length / (maxSpeed * (1 - (flow / capacity)))
+def linkTravelTimes(network: FlowTransportNetwork, flow: np.ndarray, optimal: bool = False,
+                    costFunction=BPRcostFunction, use_max_capacity: bool = False) -> np.ndarray:
+    """
+    Travel time of every link (in linkSet order) with the given flows, evaluated with costVector on the
+    array-backed link attributes and returned in double precision
+    """
+    attributes = network.linkAttributes
+    return costVector(costFunction, optimal, attributes["fft"], attributes["alpha"], flow,
+                      attributes["max_capacity"] if use_max_capacity else attributes["capacity"], attributes["beta"],
+                      attributes["length"], attributes["speedLimit"]).astype(float, copy=False)
 
 
 def updateTravelTime(network: FlowTransportNetwork, optimal: bool = False, costFunction=BPRcostFunction):
     """
-    This method updates the travel time on the links with the current flow
-    """
-    for l in network.linkSet:
-        network.linkSet[l].cost1 = vot1*costFunction(optimal,
-                                               network.linkSet[l].fft,
-                                               network.linkSet[l].alpha,
-                                               network.linkSet[l].flow,
-                                               network.linkSet[l].capacity,
-                                               network.linkSet[l].beta,
-                                               network.linkSet[l].length,
-                                               network.linkSet[l].speedLimit
-                                               )+price1*network.linkSet[l].length
-        network.linkSet[l].cost2 = vot2*costFunction(optimal,
-                                               network.linkSet[l].fft,
-                                               network.linkSet[l].alpha,
-                                               network.linkSet[l].flow,
-                                               network.linkSet[l].capacity,
-                                               network.linkSet[l].beta,
-                                               network.linkSet[l].length,
-                                               network.linkSet[l].speedLimit
-                                               )+price2*network.linkSet[l].length
+    This method updates the travel time on the links with the current flow,
+    the generalized cost of each user class includes the distance price and the toll of the class
+    """
+    attributes = network.linkAttributes
+    travelTime = linkTravelTimes(network, network.link_column("flow"), optimal=optimal, costFunction=costFunction)
+    cost1 = vot1 * travelTime + price1 * attributes["length"] + attributes["toll1"]
+    cost2 = vot2 * travelTime + price2 * attributes["length"] + attributes["toll2"]
+    for link, linkCost1, linkCost2 in zip(network.linkSet.values(), cost1.tolist(), cost2.tolist()):
+        link.cost1 = linkCost1
+        link.cost2 = linkCost2
 
 
 # def findAlpha_2(x_bar, network: FlowTransportNetwork, optimal: bool = False, costFunction=BPRcostFunction):
@@ -298,42 +450,37 @@ def updateTravelTime(network: FlowTransportNetwork, optimal: bool = False, costF
 #         alpha2=1
 #     return [alpha1,alpha2]
 
-def findAlpha(x_bar, network: FlowTransportNetwork, optimal: bool = False, costFunction=BPRcostFunction):
-
+def lineDerivative(x_bar, network: FlowTransportNetwork, optimal: bool = False, costFunction=BPRcostFunction):
     """
-    This uses unconstrained optimization to calculate the optimal step size required
-    for Frank-Wolfe Algorithm
+    Returns the derivative, as a function of the step size alpha, of the line search objective
+    along the direction from the current flows to the auxiliary flows x_bar
     """
+    attributes = network.linkAttributes
+    flow1 = network.link_column("flow1")
+    flow2 = network.link_column("flow2")
+    direction1 = np.fromiter(x_bar[0].values(), dtype=float, count=len(flow1)) - flow1
+    direction2 = np.fromiter(x_bar[1].values(), dtype=float, count=len(flow2)) - flow2
+    fixedCost1 = price1 * attributes["length"] + attributes["toll1"]
+    fixedCost2 = price2 * attributes["length"] + attributes["toll2"]
 
     def df(alpha):
         assert 0 <= alpha <= 1
-        sum_derivative = 0  # this line is the derivative of the objective function.
-        for l in network.linkSet:
-            tmpFlow1 = alpha * (x_bar[0][l]) + (1 - alpha) * network.linkSet[l].flow1
-            tmpFlow2 = alpha * (x_bar[1][l]) + (1 - alpha) * network.linkSet[l].flow2
-            tmpFlow=tmpFlow1+tmpFlow2
+        tmpFlow = flow1 + flow2 + alpha * (direction1 + direction2)
+        tmpCost = linkTravelTimes(network, tmpFlow, optimal=optimal, costFunction=costFunction)
+        # this is the derivative of the objective function.
+        return float(np.sum(direction1 * (tmpCost * vot1 + fixedCost1) + direction2 * (tmpCost * vot2 + fixedCost2)))
 
-            tmpCost = costFunction(optimal,
-                                   network.linkSet[l].fft,
-                                   network.linkSet[l].alpha,
-                                   tmpFlow,
-                                   network.linkSet[l].capacity,
-                                   network.linkSet[l].beta,
-                                   network.linkSet[l].length,
-                                   network.linkSet[l].speedLimit
-                                   )
-            tmpCost_c1=tmpCost*vot1+price1*network.linkSet[l].length
-            tmpCost_c2=tmpCost*vot2+price2*network.linkSet[l].length
+    return df
 
-            #sum_derivative = sum_derivative + (x_bar[l] - network.linkSet[l].flow) * tmpCost
-            sum_derivative = sum_derivative + (x_bar[0][l]-network.linkSet[l].flow1) * tmpCost_c1 + (x_bar[1][l]-network.linkSet[l].flow2) * tmpCost_c2
 
-        return sum_derivative
+def findAlpha(x_bar, network: FlowTransportNetwork, optimal: bool = False, costFunction=BPRcostFunction):
 
-    sol = scipy.optimize.root_scalar(df, x0=np.array([0.5]), bracket=(0, 1))
-    assert 0 <= sol.root <= 1
-    return sol.root
+    """
+    This uses unconstrained optimization to calculate the optimal step size required
+    for Frank-Wolfe Algorithm
+    """
 
+    return exactStep(lineDerivative(x_bar, network=network, optimal=optimal, costFunction=costFunction))
 
 
 def tracePreds(dest, network: FlowTransportNetwork):
@@ -349,15 +496,124 @@ def tracePreds(dest, network: FlowTransportNetwork):
     return spLinks
 
 
-def loadAON(network: FlowTransportNetwork, computeXbar: bool = True):
+def _selectTreeLinks(network: FlowTransportNetwork) -> set:
+    """
+    Registered select links in the shortest path tree of the last Dijkstra search,
+    only the OD pairs of the origin whose path ends past one of them use a select link
+    """
+    return {link for link in network.selectLinks if network.nodeSet[link[1]].pred == link[0]}
+
+
+def _accumulateSelect(selectAux: dict, user_class: int, r: str, s: str, demand: float, spLinks: list,
+                      treeSelectLinks: set, network: FlowTransportNetwork):
+    """
+    Adds the demand of an OD pair to the select-link and select-zone auxiliary flows crossed by its shortest path
+    """
+    zones = [zone for zone in (r, s) if zone in network.selectZones]
+    for spLink in spLinks:
+        if spLink in treeSelectLinks:
+            odFlows = selectAux.setdefault((spLink, user_class), {})
+            odFlows[r, s] = odFlows.get((r, s), 0.0) + demand
+        for zone in zones:
+            linkFlows = selectAux.setdefault((zone, user_class), {})
+            linkFlows[spLink] = linkFlows.get(spLink, 0.0) + demand
+
+
+class SelectFlowAverage:
+    """
+    Running averages of the select-link OD flows and of the select-zone link flows during the assignment,
+    in dicts (link, user_class) -> {(r, s): flow} and (zone, user_class) -> {link: flow}.
+
+    The stored flows are the averages divided by a common scale, so a step only touches the auxiliary flows of
+    the iteration instead of all the averaged flows. The sparse matrices of network.selectLinkFlows and
+    network.selectZoneFlows are built once, by store(), at the end of the assignment.
+    """
+
+    def __init__(self, network: FlowTransportNetwork, warmStart: bool = False):
+        """
+        :param warmStart: True to continue the averages of the select flows stored on the network
+        """
+        self.network = network
+        self.flows = {}
+        self.scale = 1.0
+        if warmStart:
+            zones = sorted(network.zoneSet, key=int)
+            links = list(network.linkSet)
+            for key, matrix in network.selectLinkFlows.items():
+                matrix = matrix.tocoo()
+                self.flows[key] = {(zones[r], zones[s]): flow
+                                   for r, s, flow in zip(matrix.row, matrix.col, matrix.data)}
+            for key, vector in network.selectZoneFlows.items():
+                vector = vector.tocoo()
+                self.flows[key] = {links[l]: flow for l, flow in zip(vector.col, vector.data)}
+
+    def update(self, selectAux: dict, alpha: float):
+        """
+        Applies the step size alpha to the select flows, in the same way as the link flows
+        """
+        if alpha >= 1:
+            self.flows = {key: {k: flow for k, flow in auxFlows.items() if flow} for key, auxFlows in selectAux.items()}
+            self.scale = 1.0
+            return
+        self.scale *= 1 - alpha
+        if self.scale < 1e-100:
+            # Fold the scale into the flows before the stored flows overflow
+            self.flows = {key: {k: flow * self.scale for k, flow in flows.items()} for key, flows in self.flows.items()}
+            self.scale = 1.0
+        weight = alpha / self.scale
+        for key, auxFlows in selectAux.items():
+            flows = self.flows.setdefault(key, {})
+            for k, flow in auxFlows.items():
+                if flow:
+                    flows[k] = flows.get(k, 0.0) + weight * flow
+
+    def store(self):
+        """
+        Stores the averaged select flows in network.selectLinkFlows and network.selectZoneFlows
+        """
+        network = self.network
+        zoneIndex = network.zone_index()
+        linkIndex = network.link_index()
+        network.selectLinkFlows = {}
+        network.selectZoneFlows = {}
+        for user_class in (1, 2):
+            for link in network.selectLinks:
+                odFlows = self.flows.get((link, user_class), {})
+                network.selectLinkFlows[link, user_class] = scipy.sparse.csr_matrix(
+                    (np.fromiter(odFlows.values(), dtype=float, count=len(odFlows)) * self.scale,
+                     ([zoneIndex[r] for r, _ in odFlows], [zoneIndex[s] for _, s in odFlows])),
+                    shape=(len(zoneIndex), len(zoneIndex)))
+            for zone in network.selectZones:
+                linkFlows = self.flows.get((zone, user_class), {})
+                network.selectZoneFlows[zone, user_class] = scipy.sparse.csr_matrix(
+                    (np.fromiter(linkFlows.values(), dtype=float, count=len(linkFlows)) * self.scale,
+                     ([0] * len(linkFlows), [linkIndex[l] for l in linkFlows])),
+                    shape=(1, len(linkIndex)))
+
+
+def loadAON(network: FlowTransportNetwork, computeXbar: bool = True, selectAux: dict = None, x_bar: list = None,
+            classSPTT: list = None):
     """
     This method produces auxiliary flows for all or nothing loading.
+    If selectAux is given, it is filled with the auxiliary flows of the registered select links and zones.
+    If x_bar is given, its two dicts are zeroed and reused instead of allocating new ones.
+    No auxiliary flows are allocated when computeXbar is False.
+    If classSPTT is given, it is filled with the shortest path total travel time of each user class.
     """
-    x_bar1 = {l: 0.0 for l in network.linkSet}
-    x_bar2 = {l: 0.0 for l in network.linkSet}
+    if not computeXbar:
+        x_bar1 = x_bar2 = None
+    elif x_bar is None:
+        x_bar1 = {l: 0.0 for l in network.linkSet}
+        x_bar2 = {l: 0.0 for l in network.linkSet}
+    else:
+        x_bar1, x_bar2 = x_bar
+        for l in x_bar1:
+            x_bar1[l] = 0.0
+            x_bar2[l] = 0.0
     SPTT = 0.0
     for r in network.originZones:
         DijkstraHeap(r, network=network,user_class=1)
+        treeSelectLinks = _selectTreeLinks(network) if selectAux is not None else None
         for s in network.zoneSet[r].destList:
             dem1 = network.tripSet[r, s].demand
 
@@ -367,13 +623,19 @@ def loadAON(network: FlowTransportNetwork, computeXbar: bool = True):
             SPTT = SPTT + network.nodeSet[s].label * dem1
 
             if computeXbar and r != s:
-                for spLink in tracePreds(s, network):
+                spLinks = tracePreds(s, network)
+                for spLink in spLinks:
                     x_bar1[spLink] = x_bar1[spLink] + dem1
+                if selectAux is not None and (treeSelectLinks or r in network.selectZones or
+                                              s in network.selectZones):
+                    _accumulateSelect(selectAux, 1, r, s, dem1, spLinks, treeSelectLinks, network)
 
+    SPTT1 = SPTT
     for r in network.originZones:
         DijkstraHeap(r, network=network,user_class=2)
+        treeSelectLinks = _selectTreeLinks(network) if selectAux is not None else None
         for s in network.zoneSet[r].destList:
-            dem2 = network.tripSet[r, s].demand
+            dem2 = network.tripSet[r, s].demand2
 
             if dem2 <= 0:
                 continue
@@ -381,35 +643,76 @@ def loadAON(network: FlowTransportNetwork, computeXbar: bool = True):
             SPTT = SPTT + network.nodeSet[s].label * dem2
 
             if computeXbar and r != s:
-                for spLink in tracePreds(s, network):
+                spLinks = tracePreds(s, network)
+                for spLink in spLinks:
                     x_bar2[spLink] = x_bar2[spLink] + dem2
+                if selectAux is not None and (treeSelectLinks or r in network.selectZones or
+                                              s in network.selectZones):
+                    _accumulateSelect(selectAux, 2, r, s, dem2, spLinks, treeSelectLinks, network)
 
+    if classSPTT is not None:
+        classSPTT[:] = [SPTT1, SPTT - SPTT1]
 
-    x_bar=[x_bar1,x_bar2]
+    if x_bar is None:
+        x_bar = [x_bar1, x_bar2]
 
     return SPTT, x_bar
 
 
 def readDemand(demand_df: pd.DataFrame, network: FlowTransportNetwork):
+    """
+    Reads the demand of both user classes, the optional "demand2" column holds the demand of user class 2,
+    without it both classes have the same demand
+    """
+    hasDemand2 = "demand2" in demand_df.columns
     for index, row in demand_df.iterrows():
 
         init_node = str(int(row["init_node"]))
         term_node = str(int(row["term_node"]))
         demand = row["demand"]
+        demand2 = row["demand2"] if hasDemand2 else None
 
-        network.tripSet[init_node, term_node] = Demand(init_node, term_node, demand)
+        newTrip = (init_node, term_node) not in network.tripSet
+        network.tripSet[init_node, term_node] = Demand(init_node, term_node, demand, demand2)
         if init_node not in network.zoneSet:
             network.zoneSet[init_node] = Zone(init_node)
         if term_node not in network.zoneSet:
             network.zoneSet[term_node] = Zone(term_node)
-        if term_node not in network.zoneSet[init_node].destList:
+        if newTrip:
             network.zoneSet[init_node].destList.append(term_node)
 
     print(len(network.tripSet), "OD pairs")
     print(len(network.zoneSet), "OD zones")
 
 
+def readClassDemand(demand_df: pd.DataFrame, network: FlowTransportNetwork):
+    """
+    Reads the demand of user class 2 from a separate table, OD pairs missing from the table get no class 2 demand
+    """
+    for trip in network.tripSet.values():
+        trip.demand2 = 0.0
+    for index, row in demand_df.iterrows():
+
+        init_node = str(int(row["init_node"]))
+        term_node = str(int(row["term_node"]))
+
+        if (init_node, term_node) not in network.tripSet:
+            network.tripSet[init_node, term_node] = Demand(init_node, term_node, 0.0)
+            for zone in (init_node, term_node):
+                if zone not in network.zoneSet:
+                    network.zoneSet[zone] = Zone(zone)
+            network.zoneSet[init_node].destList.append(term_node)
+        network.tripSet[init_node, term_node].demand2 = float(row["demand"])
+
+
 def readNetwork(network_df: pd.DataFrame, network: FlowTransportNetwork):
+    attributes = newLinkAttributes(len(network.linkSet) + len(network_df), network.precision)
+    for attribute, values in network.linkAttributes.items():
+        attributes[attribute][:len(values)] = values
+    for link in network.linkSet.values():
+        link._attributes = attributes
+    network.linkAttributes = attributes
+
     for index, row in network_df.iterrows():
 
         init_node = str(int(row["init_node"]))
@@ -423,6 +726,9 @@ def readNetwork(network_df: pd.DataFrame, network: FlowTransportNetwork):
         toll = row["toll"]
         link_type = row["link_type"]
 
+        # A repeated link replaces the previous one at the same position, so the arrays follow the linkSet order
+        position = network.linkSet[init_node, term_node]._index if (init_node, term_node) in network.linkSet else (
+            len(network.linkSet))
         network.linkSet[init_node, term_node] = Link(init_node=init_node,
                                                      term_node=term_node,
                                                      capacity=capacity,
@@ -432,7 +738,9 @@ def readNetwork(network_df: pd.DataFrame, network: FlowTransportNetwork):
                                                      power=power,
                                                      speed_limit=speed,
                                                      toll=toll,
-                                                     linkType=link_type
+                                                     linkType=link_type,
+                                                     attributes=attributes,
+                                                     index=position
                                                      )
         if init_node not in network.nodeSet:
             network.nodeSet[init_node] = Node(init_node)
@@ -443,50 +751,29 @@ def readNetwork(network_df: pd.DataFrame, network: FlowTransportNetwork):
         if init_node not in network.nodeSet[term_node].inLinks:
             network.nodeSet[term_node].inLinks.append(init_node)
 
+    for attribute, values in attributes.items():
+        attributes[attribute] = values[:len(network.linkSet)]
+
     print(len(network.nodeSet), "nodes")
     print(len(network.linkSet), "links")
 
 
 def get_TSTT(network: FlowTransportNetwork, costFunction=BPRcostFunction, use_max_capacity: bool = True):
-    TSTT = round(sum([network.linkSet[l].flow1  * vot1 * costFunction(optimal=False,
-                                                             fft=network.linkSet[
-                                                                 l].fft,
-                                                             alpha=network.linkSet[
-                                                                 l].alpha,
-                                                             flow=network.linkSet[
-                                                                 l].flow,
-                                                             capacity=network.linkSet[
-                                                                 l].max_capacity if use_max_capacity else network.linkSet[
-                                                                 l].capacity,
-                                                             beta=network.linkSet[
-                                                                 l].beta,
-                                                             length=network.linkSet[
-                                                                 l].length,
-                                                             maxSpeed=network.linkSet[
-                                                                 l].speedLimit
-                                                             ) for l in
-                      network.linkSet])
-                      +sum([network.linkSet[l].flow2  * vot2 * costFunction(optimal=False,
-                                                               fft=network.linkSet[
-                                                                 l].fft,
-                                                             alpha=network.linkSet[
-                                                                 l].alpha,
-                                                             flow=network.linkSet[
-                                                                 l].flow,
-                                                             capacity=network.linkSet[
-                                                                 l].max_capacity if use_max_capacity else network.linkSet[
-                                                                 l].capacity,
-                                                             beta=network.linkSet[
-                                                                 l].beta,
-                                                             length=network.linkSet[
-                                                                 l].length,
-                                                             maxSpeed=network.linkSet[
-                                                                 l].speedLimit
-                                                             ) for l in
-                      network.linkSet]), 2)
+    travelTime = linkTravelTimes(network, network.link_column("flow"), costFunction=costFunction,
+                                 use_max_capacity=use_max_capacity)
+    TSTT = round(float(np.sum(network.link_column("flow1") * vot1 * travelTime))
+                 + float(np.sum(network.link_column("flow2") * vot2 * travelTime)), 2)
     return TSTT
 
 
+def printMemoryReport(memoryReport: dict):
+    if memoryReport:
+        print("Peak memory per phase:")
+        for phase, peak in memoryReport.items():
+            print(f"  {phase}: {round(peak / 2 ** 20, 2)} MiB")
+
+
+@_stopMemoryTracing
 def assignment_loop(network: FlowTransportNetwork,
                     algorithm: str = "FW",
                     systemOptimal: bool = False,
@@ -494,130 +781,280 @@ def assignment_loop(network: FlowTransportNetwork,
                     accuracy: float = 0.001,
                     maxIter: int = 1000,
                     maxTime: int = 60,
-                    verbose: bool = True):
+                    verbose: bool = True,
+                    warmStart: bool = False,
+                    progressCallback=None,
+                    leanMemory: bool = False,
+                    memoryReport: dict = None,
+                    convergence: list = None,
+                    convergenceHistory: list = None,
+                    stepSize: StepSizePolicy = None,
+                    minIter: int = 0):
     """
     For explaination of the algorithm see Chapter 7 of:
     https://sboyles.github.io/blubook.html
     PDF:
     https://sboyles.github.io/teaching/ce392c/book.pdf
+
+    :param warmStart: True to start from the flows currently stored on the links instead of zero flow,
+           the stored flows must be feasible for the current demand
+    :param progressCallback: Optional function called as progressCallback(iteration_number, gap) after every
+           evaluation of the convergence, gap is the value of the first convergence criterion
+    :param leanMemory: True to preallocate the auxiliary flows, and the auxiliary flows of the select links and zones,
+           once and reuse them in every iteration
+    :param memoryReport: Optional dict filled with the peak traced memory (bytes) of every phase of the assignment,
+           tracing the memory slows down the assignment. The memory allocated before the tracing started is not
+           counted: the peaks include the network only if the tracing was started before loading it,
+           as computeAssingment does
+    :param convergence: Optional list of convergence criteria (see convergence.py), by default the relative gap
+           with the given accuracy. The assignment stops when all the criteria are met at their latest evaluation,
+           or when any of them stagnates
+    :param convergenceHistory: Optional list to which a dict with the criteria values, the last step size and
+           the number of line search evaluations done so far is appended at every evaluation of the convergence
+    :param stepSize: Optional step size policy (see step_size.py) used with the all-or-nothing directions,
+           by default the exact line search for "FW" and 1 / iteration for "MSA".
+           The assignment stops when the policy returns a zero step
+    :param minIter: Minimum number of flow updates before the convergence is checked, e.g. to move warm start flows
+           that already meet the criteria after a change of the costs
+
+    The convergence of the flows is checked with the shortest paths of the all-or-nothing loading of the next
+    iteration, so every iteration needs a single shortest path computation.
+
+    The OD flows through the registered select links and the link flows of the registered select zones
+    are averaged with the same step sizes as the link flows and stored in network.selectLinkFlows and
+    network.selectZoneFlows. On a warm start the stored select flows are averaged further if they were computed
+    by the assignment that produced the warm start flows, otherwise they cannot be recovered from the link flows
+    and the assignment starts from zero flow.
     """
-    network.reset_flow()
+    if algorithm not in ("FW", "MSA"):
+        print("Terminating the program.....")
+        print("The solution algorithm ", algorithm, " does not exist!")
+        raise TypeError('Algorithm must be MSA or FW')
+
+    if convergence is None:
+        convergence = [RelativeGap(accuracy)]
+    for criterion in convergence:
+        criterion.reset()
+    if stepSize is None:
+        stepSize = ExactLineSearch() if algorithm == "FW" else MSAStep()
+    stepSize.reset()
+
+    selectAnalysis = bool(network.selectLinks or network.selectZones)
+    if warmStart and selectAnalysis and not network.select_flows_match():
+        if verbose:
+            print("The select flows do not match the warm start flows, the assignment starts from zero flow")
+        warmStart = False
+    if warmStart:
+        updateTravelTime(network=network,
+                         optimal=systemOptimal,
+                         costFunction=costFunction)
+    else:
+        network.reset_flow()
+        network.selectLinkFlows = {}
+        network.selectZoneFlows = {}
+    selectFlows = SelectFlowAverage(network, warmStart=warmStart) if selectAnalysis else None
+
+    demand1 = sum(trip.demand for trip in network.tripSet.values() if trip.demand > 0)
+    demand2 = sum(trip.demand2 for trip in network.tripSet.values() if trip.demand2 > 0)
 
     iteration_number = 1
     gap = np.inf
-    TSTT = np.inf
+    converged = False
+    stagnated = False
+    zeroStep = False
+    classSPTT = [0.0, 0.0]
     assignmentStartTime = time.time()
-
-    # Check if desired accuracy is reached
-    while gap > accuracy:
-
-        # Get x_bar throug all-or-nothing assignment
-        _, x_bar = loadAON(network=network)
-
-        if algorithm == "MSA" or iteration_number == 1:
-            alpha = (1 / iteration_number)
-        elif algorithm == "FW":
-            # If using Frank-Wolfe determine the step size alpha by solving a nonlinear equation
-            alpha = findAlpha(x_bar,
-                              network=network,
-                              optimal=systemOptimal,
-                              costFunction=costFunction)
+    x_bar = [{l: 0.0 for l in network.linkSet}, {l: 0.0 for l in network.linkSet}] if leanMemory else None
+    selectAux = {} if selectAnalysis else None
+
+    while True:
+
+        # Get x_bar throug all-or-nothing assignment, with the costs of the current flows
+        if selectAnalysis and leanMemory:
+            # Zero the select auxiliary flows of the previous iteration, keeping their dicts
+            for auxFlows in selectAux.values():
+                for k in auxFlows:
+                    auxFlows[k] = 0.0
+        elif selectAnalysis:
+            selectAux = {}
+        with _memoryPhase(memoryReport, "AON"):
+            _, x_bar = loadAON(network=network, selectAux=selectAux, x_bar=x_bar if leanMemory else None,
+                               classSPTT=classSPTT)
+
+        # Check if the current flows meet the convergence criteria, using the shortest paths just computed
+        flowUpdates = iteration_number - 1
+        dueCriteria = ([c for c in convergence if c.due(flowUpdates)]
+                       if (flowUpdates > 0 or warmStart) and flowUpdates >= minIter else [])
+        if dueCriteria:
+            with _memoryPhase(memoryReport, "convergence"):
+                state = {"iteration": flowUpdates,
+                         "TSTT1": sum(link.flow1 * link.cost1 for link in network.linkSet.values()),
+                         "TSTT2": sum(link.flow2 * link.cost2 for link in network.linkSet.values()),
+                         "SPTT1": classSPTT[0],
+                         "SPTT2": classSPTT[1],
+                         "demand1": demand1,
+                         "demand2": demand2,
+                         "network": network}
+                for criterion in dueCriteria:
+                    criterion.evaluate(state)
+            gap = convergence[0].value
+
+            if convergenceHistory is not None:
+                convergenceHistory.append({"iteration": flowUpdates,
+                                           "time": round(time.time() - assignmentStartTime, 5),
+                                           **{c.name: c.value for c in convergence},
+                                           "step size": stepSize.alpha,
+                                           "step evaluations": stepSize.evaluations})
+            if progressCallback is not None:
+                progressCallback(flowUpdates, gap)
+
+            converged = all(c.met for c in convergence)
+            stagnated = any(c.stagnated for c in convergence)
+            if converged or stagnated:
+                break
+
+        if flowUpdates >= maxIter or time.time() - assignmentStartTime > maxTime:
+            break
+
+        if iteration_number == 1 and not warmStart:
+            # The first solution is the all-or-nothing assignment at free flow
+            alpha = 1
         else:
-            print("Terminating the program.....")
-            print("The solution algorithm ", algorithm, " does not exist!")
-            raise TypeError('Algorithm must be MSA or FW')
+            # The warm start flows count as the first average
+            with _memoryPhase(memoryReport, "line search"):
+                alpha = stepSize.step(iteration_number + 1 if warmStart else iteration_number,
+                                      lineDerivative(x_bar,
+                                                     network=network,
+                                                     optimal=systemOptimal,
+                                                     costFunction=costFunction),
+                                      x_bar,
+                                      network)
+            if alpha <= 0:
+                # The flows would not change and the next iteration would find the same direction
+                zeroStep = True
+                break
 
         # Apply flow improvement
-        for l in network.linkSet:
-            network.linkSet[l].flow1 = alpha * x_bar[0][l] + (1 - alpha) * network.linkSet[l].flow1
-            network.linkSet[l].flow2 = alpha * x_bar[1][l] + (1 - alpha) * network.linkSet[l].flow2
-            network.linkSet[l].flow = network.linkSet[l].flow1+network.linkSet[l].flow2
-
-        # Compute the new travel time
-        updateTravelTime(network=network,
-                         optimal=systemOptimal,
-                         costFunction=costFunction)
-
-        # Compute the relative gap
-        SPTT, _ = loadAON(network=network, computeXbar=False)
-        SPTT = round(SPTT, 9)
-        TSTT = round(sum([network.linkSet[l].flow1 * network.linkSet[l].cost1+
-                          network.linkSet[l].flow2 * network.linkSet[l].cost2 for l in
-                          network.linkSet]), 9)
+        with _memoryPhase(memoryReport, "flow update"):
+            for l in network.linkSet:
+                network.linkSet[l].flow1 = alpha * x_bar[0][l] + (1 - alpha) * network.linkSet[l].flow1
+                network.linkSet[l].flow2 = alpha * x_bar[1][l] + (1 - alpha) * network.linkSet[l].flow2
+                network.linkSet[l].flow = network.linkSet[l].flow1+network.linkSet[l].flow2
 
-        # print(TSTT, SPTT, "TSTT, SPTT, Max capacity", max([l.capacity for l in network.linkSet.values()]))
-        gap = (TSTT / SPTT) - 1
-        if gap < 0:
-            print("Error, gap is less than 0, this should not happen")
-            print("TSTT", "SPTT", TSTT, SPTT)
+            if selectAnalysis:
+                selectFlows.update(selectAux, alpha)
 
-            # Uncomment for debug
+            # Compute the new travel time
+            updateTravelTime(network=network,
+                             optimal=systemOptimal,
+                             costFunction=costFunction)
 
-            # print("Capacities:", [l.capacity for l in network.linkSet.values()])
-            # print("Flows:", [l.flow for l in network.linkSet.values()])
+        iteration_number += 1
 
-        # Compute the real total travel time (which in the case of system optimal rounting is different from the TSTT above)
-        TSTT = get_TSTT(network=network, costFunction=costFunction)
+    if selectAnalysis:
+        selectFlows.store()
+    network._selectFlowsState = network.get_flows() if selectAnalysis else None
 
-        iteration_number += 1
-        if iteration_number > maxIter:
-            if verbose:
-                print(
-                    "The assignment did not converge to the desired gap and the max number of iterations has been reached")
-                print("Assignment took", round(time.time() - assignmentStartTime, 5), "seconds")
-                print("Current gap:", round(gap, 5))
-            return TSTT
-        if time.time() - assignmentStartTime > maxTime:
-            if verbose:
-                print("The assignment did not converge to the desired gap and the max time limit has been reached")
-                print("Assignment did ", iteration_number, "iterations")
-                print("Current gap:", round(gap, 5))
-            return TSTT
+    # Compute the real total travel time (which in the case of system optimal rounting is different from the TSTT above)
+    TSTT = get_TSTT(network=network, costFunction=costFunction)
 
     if verbose:
-        print("Assignment converged in ", iteration_number, "iterations")
+        if converged:
+            print("Assignment converged in ", flowUpdates, "iterations")
+        elif stagnated:
+            print("The assignment stopped because",
+                  ", ".join(c.name for c in convergence if c.stagnated), "stagnated after", flowUpdates, "iterations")
+        elif zeroStep:
+            print("The assignment stopped because the step size policy", stepSize.name,
+                  "returned a zero step after", flowUpdates, "iterations")
+        elif flowUpdates >= maxIter:
+            print("The assignment did not converge to the desired gap and the max number of iterations has been reached")
+        else:
+            print("The assignment did not converge to the desired gap and the max time limit has been reached")
+            print("Assignment did ", flowUpdates, "iterations")
         print("Assignment took", round(time.time() - assignmentStartTime, 5), "seconds")
+        if stepSize.evaluations:
+            print("Step size policy", stepSize.name, "evaluated the line search", stepSize.evaluations, "times")
         print("Current gap:", round(gap, 5))
+        for criterion in convergence[1:]:
+            print(f"Current {criterion.name}:", round(criterion.value, 5))
+        printMemoryReport(memoryReport)
 
     return TSTT
 
 
 def writeResults(network: FlowTransportNetwork, output_file: str, costFunction=BPRcostFunction,
-                 systemOptimal: bool = False, verbose: bool = True):
-    outFile = open(output_file, "w")
-    TSTT = get_TSTT(network=network, costFunction=costFunction)
+                 systemOptimal: bool = False, verbose: bool = True, precision=np.float64):
+    """
+    Writes the per class link flows and costs, in the binary format of results_export.writeResultsBinary
+    if output_file ends with ".npz" or ".parquet", otherwise in the tab separated "_flow.tntp" format
+
+    :param precision: Floating point type of the flows and costs of the binary format (np.float64 or np.float32)
+    """
+    results = linkResultArrays(network=network, costFunction=costFunction)
+    results["TSTT"] = get_TSTT(network=network, costFunction=costFunction)
     if verbose:
-        print("\nTotal system travel time:", f'{TSTT} secs')
-    tmpOut = "Total Travel Time:\t" + str(TSTT)
-    outFile.write(tmpOut + "\n")
-    tmpOut = "Cost function used:\t" + BPRcostFunction.__name__
-    outFile.write(tmpOut + "\n")
-    tmpOut = ["User equilibrium (UE) or system optimal (SO):\t"] + ["SO" if systemOptimal else "UE"]
-    outFile.write("".join(tmpOut) + "\n\n")
-    tmpOut = "init_node\tterm_node\tflow1\tflow2\ttravelTime"
-    outFile.write(tmpOut + "\n")
-    for i in network.linkSet:
-        tmpOut = str(network.linkSet[i].init_node) + "\t" + str(
-            network.linkSet[i].term_node) + "\t" + str(
-            int(network.linkSet[i].flow1)) + "\t"+ str(
-            int(network.linkSet[i].flow2)) + "\t"  + str(costFunction(False,
-                                                               network.linkSet[i].fft,
-                                                               network.linkSet[i].alpha,
-                                                               network.linkSet[i].flow,
-                                                               network.linkSet[i].max_capacity,
-                                                               network.linkSet[i].beta,
-                                                               network.linkSet[i].length,
-                                                               network.linkSet[i].speedLimit
-                                                               ))
-        outFile.write(tmpOut + "\n")
-    outFile.close()
+        print("\nTotal system travel time:", f'{results["TSTT"]} secs')
+    if output_file.endswith(".npz") or output_file.endswith(".parquet"):
+        writeResultsBinary(results, output_file, costFunction=costFunction, systemOptimal=systemOptimal,
+                           precision=precision)
+    else:
+        writeResultsTSV(results, output_file, costFunction=costFunction, systemOptimal=systemOptimal)
+
+
+def replaceDemand(network: FlowTransportNetwork, demand_df: pd.DataFrame, demand2_df: pd.DataFrame = None):
+    """
+    Replaces the demand of the network keeping its links and nodes
+
+    :param demand2_df: Optional demand table of user class 2, by default class 2 has the demand of demand_df
+    """
+    network.tripSet = {}
+    network.zoneSet = {}
+    network._zone_index = None
+
+    readDemand(demand_df, network=network)
+    if demand2_df is not None:
+        readClassDemand(demand2_df, network=network)
+
+    network.originZones = set([k[0] for k in network.tripSet])
+
+
+def build_network(net_df: pd.DataFrame,
+                  demand_df: pd.DataFrame,
+                  demand2_df: pd.DataFrame = None,
+                  precision=np.float64) -> FlowTransportNetwork:
+    """
+    Builds the in-memory network from the network and demand tables (same columns as the processed csv files)
+
+    :param demand2_df: Optional demand table of user class 2, by default class 2 has the demand of demand_df
+    :param precision: Floating point type of the stored link attributes (np.float64 or np.float32)
+    """
+    network = FlowTransportNetwork(precision=precision)
 
+    readDemand(demand_df, network=network)
+    if demand2_df is not None:
+        readClassDemand(demand2_df, network=network)
+    readNetwork(net_df, network=network)
+
+    network.originZones = set([k[0] for k in network.tripSet])
 
+    return network
+
+
+@_stopMemoryTracing
 def load_network(net_file: str,
                  demand_file: str = None,
                  force_net_reprocess: bool = False,
-                 verbose: bool = True
+                 verbose: bool = True,
+                 memoryReport: dict = None,
+                 demand2_file: str = None,
+                 precision=np.float64
                  ) -> FlowTransportNetwork:
+    """
+    :param demand2_file: Optional demand (trips) file of user class 2 following the tntp format,
+           by default both user classes have the demand of demand_file
+    :param precision: Floating point type of the stored link attributes (np.float64 or np.float32)
+    """
     readStart = time.time()
 
     if demand_file is None:
@@ -628,18 +1065,19 @@ def load_network(net_file: str,
     if verbose:
         print(f"Loading network {net_name}...")
 
-    net_df, demand_df = import_network(
-        net_file,
-        demand_file,
-        force_reprocess=force_net_reprocess
-    )
-
-    network = FlowTransportNetwork()
+    with _memoryPhase(memoryReport, "import"):
+        net_df, demand_df = import_network(
+            net_file,
+            demand_file,
+            force_reprocess=force_net_reprocess
+        )
+        demand2_df = None
+        if demand2_file is not None:
+            demand2_df = import_demand(demand2_file, force_reprocess=force_net_reprocess)
 
-    readDemand(demand_df, network=network)
-    readNetwork(net_df, network=network)
-
-    network.originZones = set([k[0] for k in network.tripSet])
+    with _memoryPhase(memoryReport, "read network"):
+        network = build_network(net_df, demand_df, demand2_df=demand2_df, precision=precision)
+        del net_df, demand_df, demand2_df
 
     if verbose:
         print("Network", net_name, "loaded")
@@ -648,6 +1086,7 @@ def load_network(net_file: str,
     return network
 
 
+@_stopMemoryTracing
 def computeAssingment(net_file: str,
                       demand_file: str = None,
                       algorithm: str = "FW",  # FW or MSA
@@ -658,7 +1097,12 @@ def computeAssingment(net_file: str,
                       maxTime: int = 60,
                       results_file: str = None,
                       force_net_reprocess: bool = False,
-                      verbose: bool = True
+                      verbose: bool = True,
+                      leanMemory: bool = False,
+                      memoryReport: dict = None,
+                      convergence: list = None,
+                      stepSize: StepSizePolicy = None,
+                      precision=np.float64
                       ) -> float:
     """
     This is the main function to compute the user equilibrium UE (default) or system optimal (SO) traffic assignment
@@ -680,27 +1124,49 @@ def computeAssingment(net_file: str,
     :param maxIter: Maximum nuber of algorithm iterations
     :param maxTime: Maximum seconds allowed for the assignment
     :param results_file: Name of the desired file to write the results,
-           by default the result file is saved with the same name as the input network with the suffix "_flow.tntp" in the same folder
+           by default the result file is saved with the same name as the input network with the suffix "_flow.tntp" in the same folder,
+           files ending with ".npz" or ".parquet" are written in a binary columnar format
     :param force_net_reprocess: True if the network files should be reprocessed from the tntp sources
     :param verbose: print useful info in standard output
+    :param leanMemory: True to reuse the auxiliary flows of the assignment and of the select analysis in every
+           iteration instead of allocating new ones (for very large networks)
+    :param memoryReport: Optional dict filled with the peak memory (bytes) of every loading, assignment and writing
+           phase, traced from the start of the loading so that every peak includes the network and the other memory
+           in use at that point
+    :param convergence: Optional list of convergence criteria (see convergence.py) replacing the relative gap
+           with the given accuracy, e.g. [RelativeGap(0.0001), ClassRelativeGap(0.001, interval=5)]
+    :param stepSize: Optional step size policy (see step_size.py) replacing the one of the algorithm,
+           e.g. SelfRegulatingAverage() or ArmijoStep()
+    :param precision: Floating point type of the stored link attributes and of the flows and costs of binary
+           results files (np.float64 or np.float32). np.float32 halves the memory of the link attributes,
+           the flows, the costs and all the sums of the assignment stay in double precision
     :return: Totoal system travel time
     """
 
-    network = load_network(net_file=net_file, demand_file=demand_file, verbose=verbose, force_net_reprocess=force_net_reprocess)
+    if memoryReport is not None and not tracemalloc.is_tracing():
+        # A single tracing session for all the phases, stopped when the function returns
+        tracemalloc.start()
+
+    network = load_network(net_file=net_file, demand_file=demand_file, verbose=verbose, force_net_reprocess=force_net_reprocess,
+                           memoryReport=memoryReport, precision=precision)
 
     if verbose:
         print("Computing assignment...")
     TSTT = assignment_loop(network=network, algorithm=algorithm, systemOptimal=systemOptimal, costFunction=costFunction,
-                           accuracy=accuracy, maxIter=maxIter, maxTime=maxTime, verbose=verbose)
+                           accuracy=accuracy, maxIter=maxIter, maxTime=maxTime, verbose=verbose,
+                           leanMemory=leanMemory, memoryReport=memoryReport, convergence=convergence,
+                           stepSize=stepSize)
 
     if results_file is None:
         results_file = '_'.join(net_file.split("_")[:-1] + ["flow.tntp"])
 
-    writeResults(network=network,
-                 output_file=results_file,
-                 costFunction=costFunction,
-                 systemOptimal=systemOptimal,
-                 verbose=verbose)
+    with _memoryPhase(memoryReport, "write results"):
+        writeResults(network=network,
+                     output_file=results_file,
+                     costFunction=costFunction,
+                     systemOptimal=systemOptimal,
+                     verbose=verbose,
+                     precision=precision)
 
     return TSTT
 
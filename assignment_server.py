@@ -0,0 +1,335 @@
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import multiprocessing
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from assignment import *
+from utils import PathUtils
+
+costFunctions = {f.__name__: f for f in [BPRcostFunction, greenshieldsCostFunction, constantCostFunction]}
+
+# Per worker process state, filled by _initWorker
+_workerNetworks = {}
+_workerBaseFlows = {}
+_workerProgressQueue = None
+
+
+def _initWorker(networks: dict, baseFlows: dict, progressQueue):
+    global _workerNetworks, _workerBaseFlows, _workerProgressQueue
+    _workerNetworks = networks
+    _workerBaseFlows = baseFlows
+    _workerProgressQueue = progressQueue
+
+
+def _jsonNumber(value) -> float:
+    """
+    Python float of a number for the json messages (the cost functions can return numpy scalars),
+    None if it is not finite since json has no infinity or nan
+    """
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _validateScenario(scenario: dict, network: FlowTransportNetwork):
+    """
+    Raises ValueError if the scenario changes links that do not exist or sets capacities that are not positive
+    """
+    for init_node, term_node, capacityFactor in scenario.get("capacity", []):
+        if (str(init_node), str(term_node)) not in network.linkSet:
+            raise ValueError(f"Unknown link ({init_node}, {term_node})")
+        if not float(capacityFactor) > 0:
+            raise ValueError(f"The capacity factor of link ({init_node}, {term_node}) must be positive, "
+                             f"got {capacityFactor}")
+    if not float(scenario.get("demandScale", 1.0)) >= 0:
+        raise ValueError(f"The demand scale must not be negative, got {scenario['demandScale']}")
+
+
+def _runScenario(jobId: int, scenario: dict) -> dict:
+    """
+    Runs a scenario on the copy of the network held by the worker process.
+    All the scenario changes are undone before returning so the network can be reused by the next scenario.
+    """
+    network = _workerNetworks[scenario["network"]]
+    defaultParameters = getClassParameters()
+    originalDemand = {od: (trip.demand, trip.demand2) for od, trip in network.tripSet.items()}
+    demandScale = float(scenario.get("demandScale", 1.0))
+    status = {"iteration": 0, "gap": None}
+
+    def progress(iteration_number, gap):
+        status["iteration"] = iteration_number
+        status["gap"] = _jsonNumber(gap)
+        _workerProgressQueue.put((jobId, {"type": "progress", "iteration": iteration_number, "gap": status["gap"]}))
+
+    try:
+        setClassParameters(vot_1=scenario.get("vot1"),
+                           vot_2=scenario.get("vot2"),
+                           price_1=scenario.get("price1"),
+                           price_2=scenario.get("price2"))
+
+        for init_node, term_node, capacityFactor in scenario.get("capacity", []):
+            link = network.linkSet[str(init_node), str(term_node)]
+            link.capacity = link.max_capacity * float(capacityFactor)
+
+        if demandScale != 1.0:
+            for trip in network.tripSet.values():
+                trip.demand = trip.demand * demandScale
+                trip.demand2 = trip.demand2 * demandScale
+
+        warmStart = scenario.get("warmStart", True) and scenario["network"] in _workerBaseFlows
+        if warmStart:
+            # Scaling the base flows keeps them feasible for the scaled demand
+            network.set_flows(_workerBaseFlows[scenario["network"]], scale=demandScale)
+
+        startTime = time.time()
+        costFunction = costFunctions[scenario.get("costFunction", BPRcostFunction.__name__)]
+        systemOptimal = scenario.get("systemOptimal", False)
+        TSTT = assignment_loop(network=network,
+                               algorithm=scenario.get("algorithm", "FW"),
+                               systemOptimal=systemOptimal,
+                               costFunction=costFunction,
+                               accuracy=scenario.get("accuracy", 0.001),
+                               maxIter=scenario.get("maxIter", 1000),
+                               maxTime=scenario.get("maxTime", 60),
+                               verbose=False,
+                               warmStart=warmStart,
+                               progressCallback=progress)
+
+        result = {"type": "result",
+                  "network": scenario["network"],
+                  "TSTT": _jsonNumber(TSTT),
+                  "iterations": status["iteration"],
+                  "gap": status["gap"],
+                  "warmStart": warmStart,
+                  "seconds": round(time.time() - startTime, 5)}
+        if scenario.get("linkResults", False):
+            result["links"] = [[link.init_node, link.term_node, _jsonNumber(link.flow1), _jsonNumber(link.flow2),
+                                _jsonNumber(link.cost1), _jsonNumber(link.cost2)] for link in network.linkSet.values()]
+        return result
+    finally:
+        for od, (demand, demand2) in originalDemand.items():
+            network.tripSet[od].demand = demand
+            network.tripSet[od].demand2 = demand2
+        network.reset()
+        setClassParameters(vot_1=defaultParameters["vot1"],
+                           vot_2=defaultParameters["vot2"],
+                           price_1=defaultParameters["price1"],
+                           price_2=defaultParameters["price2"])
+        _workerProgressQueue.put((jobId, None))
+
+
+class AssignmentServer:
+    """
+    Long-lived assignment service.
+    The networks and their base equilibria are loaded once and kept in memory by every worker process,
+    scenarios are received as json lines on a local socket and the convergence progress and the results
+    are streamed back as json lines.
+
+    A scenario is a json object with the following keys (only "network" is required):
+        - "id": identifier echoed back in every message of the scenario
+        - "network": name of a loaded network (e.g. "SiouxFalls")
+        - "vot1", "vot2", "price1", "price2": user class parameters
+        - "capacity": list of [init_node, term_node, factor], the link capacity becomes factor * max capacity
+          (factor must be positive, a closure is a small factor)
+        - "demandScale": factor applied to the whole demand
+        - "algorithm", "costFunction", "systemOptimal", "accuracy", "maxIter", "maxTime": as in assignment_loop
+        - "warmStart": start from the base equilibrium (default True)
+        - "linkResults": return the per class link flows and costs (default False)
+    The request {"command": "networks"} lists the loaded networks.
+    """
+
+    def __init__(self,
+                 net_files: list,
+                 workers: int = None,
+                 algorithm: str = "FW",
+                 costFunction=BPRcostFunction,
+                 accuracy: float = 0.001,
+                 maxIter: int = 1000,
+                 maxTime: int = 600,
+                 verbose: bool = True):
+        self.networks = {}
+        self.baseFlows = {}
+        self.baseTSTT = {}
+        self.workers = workers or multiprocessing.cpu_count()
+        self.verbose = verbose
+
+        for net_file in net_files:
+            net_name = net_file.split("/")[-1].split("_")[0]
+            network = load_network(net_file=net_file, verbose=verbose)
+            if verbose:
+                print("Computing base equilibrium of", net_name, "...")
+            self.baseTSTT[net_name] = assignment_loop(network=network, algorithm=algorithm, costFunction=costFunction,
+                                                      accuracy=accuracy, maxIter=maxIter, maxTime=maxTime,
+                                                      verbose=verbose)
+            self.baseFlows[net_name] = network.get_flows()
+            network.reset()
+            self.networks[net_name] = network
+
+        self._jobIds = itertools.count()
+        self._jobQueues = {}
+        self._progressQueue = None
+        self._pool = None
+        self._loop = None
+
+    def _newPool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   initializer=_initWorker,
+                                   initargs=(self.networks, self.baseFlows, self._progressQueue))
+
+    def _forwardProgress(self):
+        while True:
+            item = self._progressQueue.get()
+            if item is None:
+                break
+            jobId, message = item
+            # Messages of jobs whose handler already ended (e.g. after an error) are dropped
+            messages = self._jobQueues.get(jobId)
+            if messages is not None:
+                self._loop.call_soon_threadsafe(messages.put_nowait, message)
+
+    async def _handleScenario(self, scenario: dict, writer: asyncio.StreamWriter):
+        requestId = scenario.get("id")
+
+        def send(message: dict):
+            message["id"] = requestId
+            writer.write((json.dumps(message, allow_nan=False) + "\n").encode())
+
+        if scenario.get("command") == "networks":
+            send({"type": "networks", "networks": {n: self.baseTSTT[n] for n in self.networks}})
+            await writer.drain()
+            return
+        if scenario.get("network") not in self.networks:
+            send({"type": "error", "error": f"Unknown network {scenario.get('network')}"})
+            await writer.drain()
+            return
+        try:
+            _validateScenario(scenario, self.networks[scenario["network"]])
+        except (ValueError, TypeError) as e:
+            send({"type": "error", "error": repr(e)})
+            await writer.drain()
+            return
+
+        jobId = next(self._jobIds)
+        messages = asyncio.Queue()
+        self._jobQueues[jobId] = messages
+        pool = self._pool
+        future = self._loop.run_in_executor(pool, _runScenario, jobId, scenario)
+        nextMessage = asyncio.ensure_future(messages.get())
+        try:
+            while True:
+                if not future.done():
+                    # The end of job message never arrives if the worker process dies, so the job is awaited too
+                    await asyncio.wait({nextMessage, future}, return_when=asyncio.FIRST_COMPLETED)
+                    if not nextMessage.done():
+                        if future.exception() is not None:
+                            break
+                        continue
+                message = await nextMessage
+                if message is None:
+                    break
+                send(message)
+                await writer.drain()
+                nextMessage = asyncio.ensure_future(messages.get())
+            send(await future)
+        except BrokenProcessPool as e:
+            # Only the first job failing with the broken pool replaces it
+            if pool is self._pool:
+                self._pool = self._newPool()
+            send({"type": "error", "error": repr(e)})
+        except Exception as e:
+            send({"type": "error", "error": repr(e)})
+        finally:
+            nextMessage.cancel()
+            del self._jobQueues[jobId]
+        await writer.drain()
+
+    async def _handleClient(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tasks = []
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+                try:
+                    scenario = json.loads(line)
+                except json.JSONDecodeError as e:
+                    writer.write((json.dumps({"type": "error", "error": repr(e)}, allow_nan=False) + "\n").encode())
+                    continue
+                tasks.append(asyncio.create_task(self._handleScenario(scenario, writer)))
+            await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, unix_socket: str = None):
+        """
+        Serves scenario requests until cancelled, on a unix socket if unix_socket is given, otherwise on host:port
+        """
+        self._loop = asyncio.get_running_loop()
+        self._progressQueue = multiprocessing.Queue()
+        self._pool = self._newPool()
+        forwarder = threading.Thread(target=self._forwardProgress, daemon=True)
+        forwarder.start()
+
+        if unix_socket is not None:
+            server = await asyncio.start_unix_server(self._handleClient, path=unix_socket)
+        else:
+            server = await asyncio.start_server(self._handleClient, host=host, port=port)
+        if self.verbose:
+            print("Assignment server listening on", unix_socket or f"{host}:{port}", "with", self.workers, "workers")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+            self._progressQueue.put(None)
+            forwarder.join()
+
+
+def requestScenario(scenario: dict, host: str = "127.0.0.1", port: int = 8765, unix_socket: str = None,
+                    progressCallback=None) -> dict:
+    """
+    Sends a scenario to a running AssignmentServer and waits for its result.
+
+    :param progressCallback: Optional function called as progressCallback(iteration_number, gap) for every progress message
+    :return: the result message of the scenario
+    """
+    if unix_socket is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(unix_socket)
+    else:
+        connection = socket.create_connection((host, port))
+
+    with connection, connection.makefile("rw") as stream:
+        stream.write(json.dumps(scenario) + "\n")
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if message["type"] == "progress":
+                if progressCallback is not None:
+                    progressCallback(message["iteration"], message["gap"])
+            elif message["type"] == "error":
+                raise RuntimeError(message["error"])
+            else:
+                return message
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Long-lived traffic assignment server")
+    parser.add_argument("net_files", nargs="*", default=[str(PathUtils.sioux_falls_net_file)],
+                        help="Network (net) files in the tntp format to keep in memory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix-socket", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--accuracy", type=float, default=0.001, help="Accuracy of the base equilibria")
+    args = parser.parse_args()
+
+    assignmentServer = AssignmentServer(net_files=args.net_files, workers=args.workers, accuracy=args.accuracy)
+    asyncio.run(assignmentServer.serve(host=args.host, port=args.port, unix_socket=args.unix_socket))
@@ -0,0 +1,77 @@
+import unittest
+
+from assignment import *
+
+
+class AssignmentLoopTest(unittest.TestCase):
+    """
+    Regression test of assignment_loop on Sioux Falls with the default accuracy and class parameters,
+    the expected TSTT are those of the original implementation of the algorithms
+    """
+
+    expectedTSTT = {("FW", False): 676084971.87,
+                    ("FW", True): 676116100.65,
+                    ("MSA", False): 680005301.16,
+                    ("MSA", True): 680719672.37}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.network = load_network(net_file=str(PathUtils.sioux_falls_net_file), verbose=False)
+
+    def test_tstt(self):
+        for (algorithm, systemOptimal), expected in self.expectedTSTT.items():
+            with self.subTest(algorithm=algorithm, systemOptimal=systemOptimal):
+                # No time limit, so the result does not depend on the speed of the machine
+                TSTT = assignment_loop(network=self.network,
+                                       algorithm=algorithm,
+                                       systemOptimal=systemOptimal,
+                                       accuracy=0.001,
+                                       maxIter=1000,
+                                       maxTime=10 ** 6,
+                                       verbose=False)
+                self.assertAlmostEqual(TSTT, expected, delta=0.01)
+
+
+class SelectAnalysisTest(unittest.TestCase):
+    """
+    Consistency of the select-link and select-zone flows with the link flows of the assignment
+    """
+
+    selectLinks = [("1", "2"), ("10", "15"), ("16", "10")]
+    selectZones = ["1", "13"]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.network = load_network(net_file=str(PathUtils.sioux_falls_net_file), verbose=False)
+        for link in cls.selectLinks:
+            cls.network.register_select_link(*link)
+        for zone in cls.selectZones:
+            cls.network.register_select_zone(zone)
+        assignment_loop(network=cls.network, accuracy=0.001, maxIter=1000, maxTime=10 ** 6, verbose=False)
+
+    def test_select_link_flows(self):
+        # Every vehicle on a select link belongs to an OD pair, so the OD flows add up to the link flow
+        for link in self.selectLinks:
+            for user_class in (1, 2):
+                with self.subTest(link=link, user_class=user_class):
+                    linkFlow = getattr(self.network.linkSet[link], f"flow{user_class}")
+                    self.assertAlmostEqual(self.network.selectLinkFlows[link, user_class].sum(), linkFlow,
+                                           delta=1e-6 * max(1.0, linkFlow))
+
+    def test_select_zone_flows(self):
+        # The flows of a select zone on a select link are the flows of the OD pairs from or to the zone
+        zoneIndex = self.network.zone_index()
+        linkIndex = self.network.link_index()
+        for zone in self.selectZones:
+            for link in self.selectLinks:
+                for user_class in (1, 2):
+                    with self.subTest(zone=zone, link=link, user_class=user_class):
+                        odFlows = self.network.selectLinkFlows[link, user_class].toarray()
+                        z = zoneIndex[zone]
+                        expected = odFlows[z, :].sum() + odFlows[:, z].sum() - odFlows[z, z]
+                        zoneFlow = self.network.selectZoneFlows[zone, user_class][0, linkIndex[link]]
+                        self.assertAlmostEqual(zoneFlow, expected, delta=1e-6 * max(1.0, expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import math
+from abc import ABC, abstractmethod
+
+
+class ConvergenceCriterion(ABC):
+    """
+    Base class of the stopping rules of assignment_loop.
+
+    A criterion is evaluated every `interval` iterations on the assignment state, a dict with the keys:
+        - "iteration": number of flow updates done so far
+        - "TSTT1", "TSTT2": total generalized cost of the current flows of each user class
+        - "SPTT1", "SPTT2": total generalized cost of each user class on the shortest paths at the current costs
+        - "demand1", "demand2": total demand of each user class
+        - "network": the network, holding the current link flows
+    It is met when its value is at most `tolerance`. With stagnationEvaluations set, it also reports stagnation
+    when its best value has not improved by the relative amount stagnationImprovement over that many evaluations.
+    """
+    name = "criterion"
+
+    def __init__(self,
+                 tolerance: float,
+                 interval: int = 1,
+                 stagnationEvaluations: int = None,
+                 stagnationImprovement: float = 1e-3):
+        assert interval >= 1
+        self.tolerance = tolerance
+        self.interval = interval
+        self.stagnationEvaluations = stagnationEvaluations
+        self.stagnationImprovement = stagnationImprovement
+        self.reset()
+
+    def reset(self):
+        self.value = math.inf
+        self.met = False
+        self.stagnated = False
+        self._bestValue = math.inf
+        self._evaluationsSinceBest = 0
+
+    def due(self, iteration_number: int) -> bool:
+        return iteration_number % self.interval == 0
+
+    @abstractmethod
+    def compute(self, state: dict) -> float:
+        pass
+
+    def evaluate(self, state: dict) -> float:
+        self.value = self.compute(state)
+        self.met = self.value <= self.tolerance
+
+        if self.stagnationEvaluations is not None:
+            if self.value < self._bestValue * (1 - self.stagnationImprovement):
+                self._bestValue = self.value
+                self._evaluationsSinceBest = 0
+            else:
+                self._evaluationsSinceBest += 1
+            self.stagnated = self._evaluationsSinceBest >= self.stagnationEvaluations
+        return self.value
+
+
+class RelativeGap(ConvergenceCriterion):
+    """
+    Relative gap of both user classes together: TSTT / SPTT - 1
+    """
+    name = "relative gap"
+
+    def compute(self, state: dict) -> float:
+        TSTT = state["TSTT1"] + state["TSTT2"]
+        SPTT = state["SPTT1"] + state["SPTT2"]
+        gap = TSTT / SPTT - 1
+        if gap < 0:
+            print("Error, gap is less than 0, this should not happen")
+            print("TSTT", "SPTT", TSTT, SPTT)
+        return gap
+
+
+class ClassRelativeGap(ConvergenceCriterion):
+    """
+    Largest relative gap of the single user classes,
+    a class can be far from equilibrium while the combined relative gap is small
+    """
+    name = "class relative gap"
+
+    def compute(self, state: dict) -> float:
+        self.classGaps = [state["TSTT1"] / state["SPTT1"] - 1 if state["SPTT1"] > 0 else 0.0,
+                          state["TSTT2"] / state["SPTT2"] - 1 if state["SPTT2"] > 0 else 0.0]
+        return max(self.classGaps)
+
+
+class AverageExcessCost(ConvergenceCriterion):
+    """
+    Average excess cost: (TSTT - SPTT) / total demand, in cost units per trip
+    """
+    name = "average excess cost"
+
+    def compute(self, state: dict) -> float:
+        demand = state["demand1"] + state["demand2"]
+        return (state["TSTT1"] + state["TSTT2"] - state["SPTT1"] - state["SPTT2"]) / demand if demand > 0 else 0.0
+
+
+class FlowChange(ConvergenceCriterion):
+    """
+    Relative change of the link flows of both classes since the previous evaluation: |x - x_prev| / |x|
+    with the given norm (2 for euclidean, math.inf for the largest change)
+    """
+    name = "flow change"
+
+    def __init__(self, tolerance: float, norm: float = 2, **kwargs):
+        self.norm = norm
+        super().__init__(tolerance, **kwargs)
+
+    def reset(self):
+        super().reset()
+        self._previousFlows = None
+        self._spareFlows = None
+
+    def _normOf(self, values) -> float:
+        if self.norm == math.inf:
+            return max(values, default=0.0)
+        return sum(v ** self.norm for v in values) ** (1 / self.norm)
+
+    def compute(self, state: dict) -> float:
+        # The flows of the previous evaluation and the current ones are kept in two pairs of dicts (link -> flow
+        # of each class) that are swapped and overwritten, instead of allocating new ones at every evaluation
+        flows = self._spareFlows if self._spareFlows is not None else ({}, {})
+        for l, link in state["network"].linkSet.items():
+            flows[0][l] = link.flow1
+            flows[1][l] = link.flow2
+        previousFlows = self._previousFlows
+        self._previousFlows, self._spareFlows = flows, previousFlows
+        if previousFlows is None:
+            return math.inf
+        change = self._normOf(abs(flows[c][l] - previousFlows[c][l]) for c in (0, 1) for l in flows[c])
+        size = self._normOf(abs(f) for c in (0, 1) for f in flows[c].values())
+        return change / size if size > 0 else 0.0
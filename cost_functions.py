@@ -0,0 +1,114 @@
+import math
+
+import numpy as np
+
+
+def BPRcostFunction(optimal: bool,
+                    fft: float,
+                    alpha: float,
+                    flow: float,
+                    capacity: float,
+                    beta: float,
+                    length: float,
+                    maxSpeed: float
+                    ) -> float:
+    if capacity < 1e-3:
+        return np.finfo(np.float32).max
+    if optimal:
+        return fft * (1 + (alpha * math.pow((flow * 1.0 / capacity), beta)) * (beta + 1))
+    return fft * (1 + alpha * math.pow((flow * 1.0 / capacity), beta))
+
+
+def constantCostFunction(optimal: bool,
+                         fft: float,
+                         alpha: float,
+                         flow: float,
+                         capacity: float,
+                         beta: float,
+                         length: float,
+                         maxSpeed: float
+                         ) -> float:
+    if optimal:
+        return fft + flow
+    return fft
+
+
+def greenshieldsCostFunction(optimal: bool,
+                             fft: float,
+                             alpha: float,
+                             flow: float,
+                             capacity: float,
+                             beta: float,
+                             length: float,
+                             maxSpeed: float
+                             ) -> float:
+    if capacity < 1e-3:
+        return np.finfo(np.float32).max
+    if optimal:
+        return (length * (capacity ** 2)) / (maxSpeed * (capacity - flow) ** 2)
+    return length / (maxSpeed * (1 - (flow / capacity)))
+
+
+def BPRcostVector(optimal: bool,
+                  fft: np.ndarray,
+                  alpha: np.ndarray,
+                  flow: np.ndarray,
+                  capacity: np.ndarray,
+                  beta: np.ndarray,
+                  length: np.ndarray,
+                  maxSpeed: np.ndarray
+                  ) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        if optimal:
+            cost = fft * (1 + (alpha * np.power(flow / capacity, beta)) * (beta + 1))
+        else:
+            cost = fft * (1 + alpha * np.power(flow / capacity, beta))
+    return np.where(capacity < 1e-3, np.finfo(np.float32).max, cost)
+
+
+def constantCostVector(optimal: bool,
+                       fft: np.ndarray,
+                       alpha: np.ndarray,
+                       flow: np.ndarray,
+                       capacity: np.ndarray,
+                       beta: np.ndarray,
+                       length: np.ndarray,
+                       maxSpeed: np.ndarray
+                       ) -> np.ndarray:
+    if optimal:
+        return fft + flow
+    return fft.copy()
+
+
+def greenshieldsCostVector(optimal: bool,
+                           fft: np.ndarray,
+                           alpha: np.ndarray,
+                           flow: np.ndarray,
+                           capacity: np.ndarray,
+                           beta: np.ndarray,
+                           length: np.ndarray,
+                           maxSpeed: np.ndarray
+                           ) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if optimal:
+            cost = (length * (capacity ** 2)) / (maxSpeed * (capacity - flow) ** 2)
+        else:
+            cost = length / (maxSpeed * (1 - (flow / capacity)))
+    return np.where(capacity < 1e-3, np.finfo(np.float32).max, cost)
+
+
+# Array versions of the cost functions, cost functions without one are evaluated link by link
+vectorCostFunctions = {BPRcostFunction: BPRcostVector,
+                       constantCostFunction: constantCostVector,
+                       greenshieldsCostFunction: greenshieldsCostVector}
+
+
+def costVector(costFunction, optimal: bool, fft: np.ndarray, alpha: np.ndarray, flow: np.ndarray,
+               capacity: np.ndarray, beta: np.ndarray, length: np.ndarray, maxSpeed: np.ndarray) -> np.ndarray:
+    """
+    Evaluates a cost function on arrays of link attributes
+    """
+    if costFunction in vectorCostFunctions:
+        return vectorCostFunctions[costFunction](optimal, fft, alpha, flow, capacity, beta, length, maxSpeed)
+    return np.fromiter((costFunction(optimal, *attributes) for attributes in
+                        zip(fft, alpha, flow, capacity, beta, length, maxSpeed)), dtype=float, count=len(fft))
@@ -0,0 +1,237 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from assignment import *
+from results_export import linkResultArrays, resultColumns
+from utils import PathUtils
+
+# Per worker process network, filled by _initWorker
+_workerNetwork = None
+
+
+def _initWorker(network: FlowTransportNetwork):
+    global _workerNetwork
+    _workerNetwork = network
+
+
+def _periodDemand(demand, force_reprocess: bool = False):
+    """
+    Returns the demand tables of the two user classes of a period, given as a trips file or a demand table,
+    or as a tuple with one of them per user class
+    """
+    demand, demand2 = demand if isinstance(demand, (tuple, list)) else (demand, None)
+    tables = []
+    for d in (demand, demand2):
+        if d is None or isinstance(d, pd.DataFrame):
+            tables.append(d)
+        else:
+            tables.append(import_demand(str(d), force_reprocess=force_reprocess))
+    return tables
+
+
+def _demandVector(demand_df: pd.DataFrame, demand2_df: pd.DataFrame = None) -> dict:
+    """
+    Demand of the two user classes by OD pair
+    """
+    vector = {(str(int(i)), str(int(j))): np.array([d, d]) for i, j, d in
+              zip(demand_df["init_node"], demand_df["term_node"], demand_df["demand"])}
+    if "demand2" in demand_df.columns:
+        for i, j, d in zip(demand_df["init_node"], demand_df["term_node"], demand_df["demand2"]):
+            vector[str(int(i)), str(int(j))][1] = d
+    if demand2_df is not None:
+        for v in vector.values():
+            v[1] = 0.0
+        for i, j, d in zip(demand2_df["init_node"], demand2_df["term_node"], demand2_df["demand"]):
+            vector.setdefault((str(int(i)), str(int(j))), np.zeros(2))[1] = d
+    return vector
+
+
+def _similarity(demand: dict, seedDemand: dict):
+    """
+    Least squares scaling of the seed demand of every user class to the demand
+    and the relative residual of the scaled seed demand
+    """
+    ods = demand.keys() | seedDemand.keys()
+    new = np.array([demand.get(od, (0.0, 0.0)) for od in ods])
+    seed = np.array([seedDemand.get(od, (0.0, 0.0)) for od in ods])
+    seedNorm = (seed * seed).sum(axis=0)
+    scales = np.divide((new * seed).sum(axis=0), seedNorm, out=np.zeros(2), where=seedNorm > 0)
+    residual = np.linalg.norm(new - seed * scales) / max(np.linalg.norm(new), 1e-12)
+    return scales, residual
+
+
+def _warmStartFlows(network: FlowTransportNetwork, demand: dict, seedDemand: dict, seedFlows: dict, scales,
+                    systemOptimal: bool, costFunction) -> bool:
+    """
+    Sets on the network (which already has the new demand) a feasible warm start built from a solved period:
+    the seed flows of every class are scaled and the remaining demand difference, which can be negative,
+    is loaded all-or-nothing on the shortest paths at the seed costs.
+    Loading the difference keeps the flow conservation exact; if a link flow becomes negative
+    the warm start is discarded and False is returned.
+    """
+    network.set_flows(seedFlows)
+    updateTravelTime(network=network, optimal=systemOptimal, costFunction=costFunction)
+
+    correction = [{l: 0.0 for l in network.linkSet}, {l: 0.0 for l in network.linkSet}]
+    differences = {}
+    for od in demand.keys() | seedDemand.keys():
+        difference = np.asarray(demand.get(od, (0.0, 0.0))) - scales * np.asarray(seedDemand.get(od, (0.0, 0.0)))
+        if od[0] != od[1] and difference.any():
+            differences.setdefault(od[0], []).append((od[1], difference))
+
+    for user_class in (1, 2):
+        for r, destinations in differences.items():
+            if r not in network.nodeSet:
+                return False
+            DijkstraHeap(r, network=network, user_class=user_class)
+            for s, difference in destinations:
+                if difference[user_class - 1] == 0:
+                    continue
+                if network.nodeSet[s].label == np.inf:
+                    return False
+                for spLink in tracePreds(s, network):
+                    correction[user_class - 1][spLink] += difference[user_class - 1]
+
+    warmFlows = {}
+    for l, (flow1, flow2) in seedFlows.items():
+        flow1 = scales[0] * flow1 + correction[0][l]
+        flow2 = scales[1] * flow2 + correction[1][l]
+        if min(flow1, flow2) < -1e-6:
+            return False
+        warmFlows[l] = (max(float(flow1), 0.0), max(float(flow2), 0.0))
+    network.set_flows(warmFlows)
+    return True
+
+
+def _linkResults(network: FlowTransportNetwork, costFunction) -> pd.DataFrame:
+    results = linkResultArrays(network=network, costFunction=costFunction)
+    return pd.DataFrame({c: results[c] for c in resultColumns})
+
+
+def _solvePeriod(period, demand_df: pd.DataFrame, demand2_df: pd.DataFrame, settings: dict):
+    """
+    Cold solve of a period on the network held by the worker process
+    """
+    replaceDemand(_workerNetwork, demand_df, demand2_df)
+    TSTT = assignment_loop(network=_workerNetwork, verbose=False, **settings)
+    return period, TSTT, _linkResults(_workerNetwork, settings["costFunction"])
+
+
+def multiPeriodAssignment(net_file: str,
+                          periods: dict,
+                          parallel: bool = False,
+                          workers: int = None,
+                          algorithm: str = "FW",
+                          costFunction=BPRcostFunction,
+                          systemOptimal: bool = False,
+                          accuracy: float = 0.0001,
+                          maxIter: int = 1000,
+                          maxTime: int = 60,
+                          results_file: str = None,
+                          force_net_reprocess: bool = False,
+                          verbose: bool = True
+                          ) -> dict:
+    """
+    Computes the assignment of several periods (e.g. AM peak, interpeak, PM peak, night) with different demand
+    on the same network, which is loaded only once.
+
+    With parallel=False the first period is solved from zero flow and every other period is warm started from the
+    solved period with the most similar demand (least squares scaling of its demand, per user class).
+    With parallel=True all the periods are solved from zero flow at the same time by a pool of worker processes.
+
+    :param net_file: Name of the network (net) file following the tntp format
+    :param periods: dict period name -> demand of the period, given as a trips file following the tntp format or
+           as a demand table (same columns as the processed trips), or as a tuple (class 1 demand, class 2 demand)
+    :param parallel: True to solve the periods in parallel instead of warm starting them
+    :param workers: Number of worker processes for parallel=True, by default one per period up to the number of cpus
+    :param results_file: Name of the file where the link results of all the periods are written,
+           by default the network name with the suffix "_periods_flow.tntp" in the same folder
+    :return: dict period name -> total system travel time
+    Other parameters are as in computeAssingment
+    """
+    periodDemands = {period: _periodDemand(demand, force_reprocess=force_net_reprocess)
+                     for period, demand in periods.items()}
+    firstPeriod = next(iter(periods))
+    if verbose:
+        print("Loading network", net_file.split("/")[-1].split("_")[0], "...")
+    network = build_network(import_net(net_file, force_reprocess=force_net_reprocess), *periodDemands[firstPeriod])
+
+    settings = dict(algorithm=algorithm, systemOptimal=systemOptimal, costFunction=costFunction,
+                    accuracy=accuracy, maxIter=maxIter, maxTime=maxTime)
+    TSTTs = {}
+    linkResults = {}
+    runStart = time.time()
+
+    if parallel:
+        with ProcessPoolExecutor(max_workers=workers or min(len(periods), multiprocessing.cpu_count()),
+                                 initializer=_initWorker, initargs=(network,)) as pool:
+            futures = [pool.submit(_solvePeriod, period, demand_df, demand2_df, settings)
+                       for period, (demand_df, demand2_df) in periodDemands.items()]
+            for future in futures:
+                period, TSTTs[period], linkResults[period] = future.result()
+                if verbose:
+                    print("Period", period, "solved, TSTT:", TSTTs[period])
+    else:
+        demandVectors = {period: _demandVector(*tables) for period, tables in periodDemands.items()}
+        solvedFlows = {}
+        remaining = list(periods)
+        while remaining:
+            seedPeriod = None
+            if solvedFlows:
+                candidates = [(_similarity(demandVectors[period], demandVectors[seed]), period, seed)
+                              for period in remaining for seed in solvedFlows]
+                # Ties are broken in favour of the seed needing the smallest scaling
+                (scales, residual), period, seedPeriod = min(
+                    candidates, key=lambda c: (round(c[0][1], 3), np.abs(c[0][0] - 1).max()))
+            else:
+                period = remaining[0]
+            remaining.remove(period)
+
+            replaceDemand(network, *periodDemands[period])
+            warmStart = seedPeriod is not None and _warmStartFlows(network,
+                                                                   demand=demandVectors[period],
+                                                                   seedDemand=demandVectors[seedPeriod],
+                                                                   seedFlows=solvedFlows[seedPeriod],
+                                                                   scales=scales,
+                                                                   systemOptimal=systemOptimal,
+                                                                   costFunction=costFunction)
+            if verbose:
+                if warmStart:
+                    print("Period", period, "warm started from period", seedPeriod,
+                          "(relative demand difference", round(residual, 5), ")")
+                else:
+                    print("Period", period, "started from zero flow")
+
+            TSTTs[period] = assignment_loop(network=network, verbose=verbose, warmStart=warmStart, **settings)
+            solvedFlows[period] = network.get_flows()
+            linkResults[period] = _linkResults(network, costFunction)
+
+    if verbose:
+        print("All", len(periods), "periods took", round(time.time() - runStart, 5), "seconds")
+
+    if results_file is None:
+        results_file = '_'.join(net_file.split("_")[:-1] + ["periods_flow.tntp"])
+
+    pd.concat([linkResults[period].assign(period=period) for period in periods], ignore_index=True).to_csv(
+        results_file, sep="\t", index=False,
+        columns=["period"] + resultColumns)
+
+    return {period: TSTTs[period] for period in periods}
+
+
+if __name__ == '__main__':
+
+    # Example with four periods obtained by scaling the Sioux Falls demand
+
+    net_file = str(PathUtils.sioux_falls_net_file)
+    demand_df = import_demand(str(PathUtils.input_networks_folder / "SiouxFalls_trips.tntp"))
+
+    periodTSTT = multiPeriodAssignment(net_file=net_file,
+                                       periods={"AM": demand_df,
+                                                "IP": demand_df.assign(demand=demand_df["demand"] * 0.6),
+                                                "PM": demand_df.assign(demand=demand_df["demand"] * 0.95),
+                                                "NT": demand_df.assign(demand=demand_df["demand"] * 0.2)},
+                                       accuracy=0.001,
+                                       verbose=True)
+    print(periodTSTT)
@@ -0,0 +1,61 @@
+import unittest
+
+from multi_period import *
+from multi_period import _demandVector, _similarity, _warmStartFlows
+
+
+class WarmStartFlowsTest(unittest.TestCase):
+    """
+    The warm start flows built from a solved period are feasible for the demand of the new period
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.demand_df = import_demand(str(PathUtils.input_networks_folder / "SiouxFalls_trips.tntp"))
+        cls.network = build_network(import_net(str(PathUtils.sioux_falls_net_file)), cls.demand_df)
+        assignment_loop(network=cls.network, accuracy=0.001, maxIter=1000, maxTime=10 ** 6, verbose=False)
+        cls.seedFlows = cls.network.get_flows()
+
+        # A period with a different demand pattern for each user class
+        rng = np.random.default_rng(0)
+        ods = len(cls.demand_df)
+        cls.period_df = cls.demand_df.assign(demand=cls.demand_df["demand"] * rng.uniform(0.5, 1.5, ods),
+                                             demand2=cls.demand_df["demand"] * rng.uniform(0.2, 0.6, ods))
+
+    def setUp(self):
+        replaceDemand(self.network, self.period_df)
+        demand = _demandVector(self.period_df)
+        seedDemand = _demandVector(self.demand_df)
+        scales, _ = _similarity(demand, seedDemand)
+        self.assertTrue(_warmStartFlows(self.network, demand=demand, seedDemand=seedDemand, seedFlows=self.seedFlows,
+                                        scales=scales, systemOptimal=False, costFunction=BPRcostFunction))
+
+    def test_flow_conservation(self):
+        # At every node the flow entering minus the flow leaving is the demand ending minus the demand starting there
+        for user_class, attribute in ((1, "demand"), (2, "demand2")):
+            balance = {node: 0.0 for node in self.network.nodeSet}
+            for (init_node, term_node), link in self.network.linkSet.items():
+                flow = getattr(link, f"flow{user_class}")
+                balance[term_node] += flow
+                balance[init_node] -= flow
+            for (r, s), trip in self.network.tripSet.items():
+                if r != s:
+                    balance[s] -= getattr(trip, attribute)
+                    balance[r] += getattr(trip, attribute)
+            with self.subTest(user_class=user_class):
+                self.assertLess(max(abs(b) for b in balance.values()), 1e-6 * self.demand_df["demand"].sum())
+
+    def test_nonnegative_flows(self):
+        self.assertGreaterEqual(min(min(link.flow1, link.flow2) for link in self.network.linkSet.values()), 0.0)
+
+    def test_warm_started_assignment(self):
+        # The warm started assignment reaches the equilibrium of the period found from zero flow
+        warmTSTT = assignment_loop(network=self.network, accuracy=0.001, maxIter=1000, maxTime=10 ** 6,
+                                   verbose=False, warmStart=True)
+        coldTSTT = assignment_loop(network=self.network, accuracy=0.001, maxIter=1000, maxTime=10 ** 6,
+                                   verbose=False)
+        self.assertAlmostEqual(warmTSTT, coldTSTT, delta=1e-3 * coldTSTT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,258 @@
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.spatial
+
+from assignment import *
+from utils import PathUtils
+
+networkColumns = ["init_node", "term_node", "capacity", "length", "free_flow_time", "b", "power", "speed", "toll",
+                  "link_type"]
+
+
+def _relabelZones(coordinates: np.ndarray, zones: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Picks the zone nodes and returns the new id of every node, the zones get the ids 1..zones as in the tntp format
+    """
+    nodes = len(coordinates)
+    assert 0 < zones <= nodes
+    zoneNodes = rng.choice(nodes, size=zones, replace=False)
+    otherNodes = np.setdiff1d(np.arange(nodes), zoneNodes)
+    nodeIds = np.empty(nodes, dtype=int)
+    nodeIds[zoneNodes] = np.arange(1, zones + 1)
+    nodeIds[otherNodes] = np.arange(zones + 1, nodes + 1)
+    return nodeIds
+
+
+def _linksDataFrame(edges: np.ndarray, coordinates: np.ndarray, nodeIds: np.ndarray, rng: np.random.Generator,
+                    speed: float, capacities: tuple, alpha: float, beta: float) -> pd.DataFrame:
+    """
+    Builds the links (in both directions) of the undirected edges with BPR parameters
+    """
+    edges = np.concatenate([edges, edges[:, ::-1]])
+    length = np.linalg.norm(coordinates[edges[:, 0]] - coordinates[edges[:, 1]], axis=1)
+    return pd.DataFrame({"init_node": nodeIds[edges[:, 0]],
+                         "term_node": nodeIds[edges[:, 1]],
+                         "capacity": rng.choice(capacities, size=len(edges)).astype(float),
+                         "length": length,
+                         "free_flow_time": length / speed,
+                         "b": alpha,
+                         "power": beta,
+                         "speed": speed,
+                         "toll": 0.0,
+                         "link_type": 1},
+                        columns=networkColumns).sort_values(["init_node", "term_node"], ignore_index=True)
+
+
+def gridNetwork(rows: int,
+                cols: int,
+                zones: int,
+                spacing: float = 1.0,
+                speed: float = 1.0,
+                capacities: tuple = (1000.0, 2000.0, 4000.0),
+                alpha: float = 0.15,
+                beta: float = 4.0,
+                seed: int = None):
+    """
+    Generates a rows x cols grid network with links in both directions between neighbouring nodes
+
+    :param zones: number of nodes used as zones
+    :param spacing: distance between neighbouring nodes
+    :param speed: free flow speed, the free flow time of a link is length / speed
+    :param capacities: link capacities, randomly assigned to the links
+    :param alpha: BPR alpha (b in the tntp format)
+    :param beta: BPR beta (power in the tntp format)
+    :return: the network table (same columns as the processed networks) and the coordinates of the nodes by node id
+    """
+    rng = np.random.default_rng(seed)
+    index = np.arange(rows * cols).reshape(rows, cols)
+    edges = np.concatenate([np.stack([index[:, :-1].ravel(), index[:, 1:].ravel()], axis=1),
+                            np.stack([index[:-1, :].ravel(), index[1:, :].ravel()], axis=1)])
+    coordinates = np.stack(np.divmod(np.arange(rows * cols), cols), axis=1).astype(float) * spacing
+
+    nodeIds = _relabelZones(coordinates, zones, rng)
+    net_df = _linksDataFrame(edges, coordinates, nodeIds, rng, speed, capacities, alpha, beta)
+    return net_df, _coordinatesById(coordinates, nodeIds)
+
+
+def randomPlanarNetwork(nodes: int,
+                        links: int,
+                        zones: int,
+                        size: float = None,
+                        speed: float = 1.0,
+                        capacities: tuple = (1000.0, 2000.0, 4000.0),
+                        alpha: float = 0.15,
+                        beta: float = 4.0,
+                        seed: int = None):
+    """
+    Generates a strongly connected planar network on random points.
+    The links are taken from the Delaunay triangulation of the points: the minimum spanning tree keeps the network
+    connected and the shortest remaining edges are added until the requested number of links is reached.
+
+    :param links: number of links, even (every edge has links in both directions),
+           between 2 * (nodes - 1) and the number of links of the triangulation (about 6 * nodes)
+    :param size: side of the square containing the points, by default the average link length is around 1
+    :return: the network table (same columns as the processed networks) and the coordinates of the nodes by node id
+    """
+    rng = np.random.default_rng(seed)
+    if size is None:
+        size = np.sqrt(nodes)
+    coordinates = rng.random((nodes, 2)) * size
+
+    triangles = scipy.spatial.Delaunay(coordinates).simplices
+    edges = np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [0, 2]]])
+    edges = np.unique(np.sort(edges, axis=1), axis=0)
+    length = np.linalg.norm(coordinates[edges[:, 0]] - coordinates[edges[:, 1]], axis=1)
+
+    edgeCount = links // 2
+    if not nodes - 1 <= edgeCount <= len(edges):
+        raise ValueError(f"The number of links must be between {2 * (nodes - 1)} and {2 * len(edges)}")
+
+    tree = scipy.sparse.csgraph.minimum_spanning_tree(
+        scipy.sparse.csr_matrix((length, (edges[:, 0], edges[:, 1])), shape=(nodes, nodes))).tocoo()
+    inTree = np.zeros(len(edges), dtype=bool)
+    edgeIndex = {(i, j): k for k, (i, j) in enumerate(edges)}
+    for i, j in zip(tree.row, tree.col):
+        inTree[edgeIndex[min(i, j), max(i, j)]] = True
+    extraEdges = np.flatnonzero(~inTree)
+    extraEdges = extraEdges[np.argsort(length[extraEdges])][:edgeCount - inTree.sum()]
+    edges = np.concatenate([edges[inTree], edges[extraEdges]])
+
+    nodeIds = _relabelZones(coordinates, zones, rng)
+    net_df = _linksDataFrame(edges, coordinates, nodeIds, rng, speed, capacities, alpha, beta)
+    return net_df, _coordinatesById(coordinates, nodeIds)
+
+
+def _coordinatesById(coordinates: np.ndarray, nodeIds: np.ndarray) -> np.ndarray:
+    coordinatesById = np.empty_like(coordinates)
+    coordinatesById[nodeIds - 1] = coordinates
+    return coordinatesById
+
+
+def gravityDemand(coordinates: np.ndarray,
+                  zones: int,
+                  totalDemand: float,
+                  impedance: float = 0.1,
+                  classShares: tuple = None,
+                  seed: int = None) -> pd.DataFrame:
+    """
+    Generates the demand between the zones (node ids 1..zones) with a gravity model:
+    T_ij = k * P_i * A_j * exp(-impedance * d_ij), with random productions P and attractions A
+    and d_ij the distance between the zones
+
+    :param coordinates: coordinates of the nodes by node id, as returned by the network generators
+    :param totalDemand: total demand of all the OD pairs
+    :param impedance: distance decay of the gravity model
+    :param classShares: optional (share of class 1, share of class 2) of the total demand,
+           by default both user classes have the whole demand as in the tntp networks
+    :return: the demand table (same columns as the processed trips, plus "demand2" if classShares is given)
+    """
+    rng = np.random.default_rng(seed)
+    zoneCoordinates = coordinates[:zones]
+    productions = rng.lognormal(size=zones)
+    attractions = rng.lognormal(size=zones)
+    distance = np.linalg.norm(zoneCoordinates[:, None, :] - zoneCoordinates[None, :, :], axis=2)
+
+    trips = productions[:, None] * attractions[None, :] * np.exp(-impedance * distance)
+    np.fill_diagonal(trips, 0.0)
+    trips *= totalDemand / trips.sum()
+
+    origins, destinations = np.meshgrid(np.arange(1, zones + 1), np.arange(1, zones + 1), indexing="ij")
+    demand_df = pd.DataFrame({"init_node": origins.ravel(), "term_node": destinations.ravel(), "demand": trips.ravel()})
+    if classShares is not None:
+        demand_df["demand2"] = demand_df["demand"] * classShares[1]
+        demand_df["demand"] = demand_df["demand"] * classShares[0]
+    return demand_df
+
+
+def writeTNTP(net_df: pd.DataFrame, demand_df: pd.DataFrame, name: str, folder: str) -> list:
+    """
+    Writes the network and the demand in the tntp format read by import_network.
+    The demand of user class 2 (if any) is written to the separate file <name>_trips2.tntp.
+
+    The processed copies that import_network keeps in the processed networks folder are named after the files,
+    so the stale copies of previously written files with the same name are removed and the new files are
+    processed again the first time they are loaded. The names of the bundled tntp networks are refused,
+    their processed copies are shared with the bundled files.
+
+    :return: the names of the written net file, trips file and class 2 trips file (None without class 2 demand)
+    """
+    bundledNames = {file.name.rsplit("_", 1)[0] for file in PathUtils.input_networks_folder.glob("*_net.tntp")}
+    if name in bundledNames:
+        raise ValueError(f"{name} is the name of a bundled network, choose another name")
+
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    zones = int(demand_df[["init_node", "term_node"]].max().max())
+
+    net_file = folder / f"{name}_net.tntp"
+    with open(net_file, "w") as outFile:
+        outFile.write(f"<NUMBER OF ZONES> {zones}\n")
+        outFile.write(f"<NUMBER OF NODES> {int(net_df[['init_node', 'term_node']].max().max())}\n")
+        outFile.write("<FIRST THRU NODE> 1\n")
+        outFile.write(f"<NUMBER OF LINKS> {len(net_df)}\n")
+        outFile.write("<ORIGINAL HEADER>~\t" + "\t".join(networkColumns) + "\t;\n")
+        outFile.write("<END OF METADATA>\n\n\n")
+        outFile.write("~\t" + "\t".join(networkColumns) + "\t;\n")
+        # Rows start with an empty "~" column, as in the tntp networks
+        net_df.assign(**{"~": ""}).to_csv(outFile, sep="\t", header=False, index=False, columns=["~"] + networkColumns,
+                                          lineterminator="\t;\n", float_format="%.6f")
+
+    trips_files = [_writeTrips(demand_df, "demand", zones, folder / f"{name}_trips.tntp")]
+    if "demand2" in demand_df.columns:
+        trips_files.append(_writeTrips(demand_df, "demand2", zones, folder / f"{name}_trips2.tntp"))
+    else:
+        trips_files.append(None)
+
+    written_files = [str(net_file)] + trips_files
+    for file in filter(None, written_files):
+        (PathUtils.processed_networks_folder / (Path(file).stem + ".csv")).unlink(missing_ok=True)
+    return written_files
+
+
+def _writeTrips(demand_df: pd.DataFrame, column: str, zones: int, trips_file: Path) -> str:
+    with open(trips_file, "w") as outFile:
+        outFile.write(f"<NUMBER OF ZONES> {zones}\n")
+        outFile.write(f"<TOTAL OD FLOW> {demand_df[column].sum():.6f}\n")
+        outFile.write("<END OF METADATA>\n\n\n")
+        for origin, group in demand_df.groupby("init_node", sort=True):
+            outFile.write(f"Origin \t{origin}\n")
+            entries = [f"{destination:5d} : {demand:10.6f};" for destination, demand in
+                       zip(group["term_node"], group[column])]
+            for k in range(0, len(entries), 5):
+                outFile.write("\t" + "\t".join(entries[k:k + 5]) + "\n")
+            outFile.write("\n")
+    return str(trips_file)
+
+
+if __name__ == '__main__':
+
+    # Scaling of the main assignment steps on grid networks of increasing size
+
+    print("links\tzones\tDijkstra (s)\tloadAON (s)\tfindAlpha (s)")
+    for side in [16, 32, 64]:
+        zones = side * side // 16
+        net_df, coordinates = gridNetwork(side, side, zones=zones, seed=0)
+        demand_df = gravityDemand(coordinates, zones=zones, totalDemand=50 * len(net_df), seed=0)
+        network = build_network(net_df, demand_df)
+
+        start = time.time()
+        DijkstraHeap(next(iter(network.originZones)), network=network, user_class=1)
+        dijkstraTime = time.time() - start
+
+        start = time.time()
+        _, x_bar = loadAON(network=network)
+        aonTime = time.time() - start
+
+        network.set_flows({l: (x_bar[0][l] / 2, x_bar[1][l] / 2) for l in network.linkSet})
+        updateTravelTime(network=network)
+        _, x_bar = loadAON(network=network)
+        start = time.time()
+        findAlpha(x_bar, network=network)
+        alphaTime = time.time() - start
+
+        print(f"{len(network.linkSet)}\t{zones}\t{dijkstraTime:.4f}\t{aonTime:.4f}\t{alphaTime:.4f}")
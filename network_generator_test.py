@@ -0,0 +1,61 @@
+import tempfile
+import unittest
+
+from network_generator import *
+
+
+class WriteTNTPTest(unittest.TestCase):
+    """
+    A synthetic network written in the tntp format and loaded back matches the network built in memory
+    """
+
+    name = "GeneratorTestGrid"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        cls.net_df, coordinates = gridNetwork(5, 5, zones=6, seed=0)
+        cls.demand_df = gravityDemand(coordinates, zones=6, totalDemand=5000, classShares=(0.7, 0.3), seed=0)
+        cls.files = writeTNTP(cls.net_df, cls.demand_df, cls.name, cls.folder.name)
+
+        cls.built = build_network(cls.net_df, cls.demand_df)
+        cls.loaded = load_network(net_file=cls.files[0], demand_file=cls.files[1], demand2_file=cls.files[2],
+                                  verbose=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        for file in filter(None, cls.files):
+            (PathUtils.processed_networks_folder / (Path(file).stem + ".csv")).unlink(missing_ok=True)
+        cls.folder.cleanup()
+
+    def test_links(self):
+        self.assertEqual(set(self.loaded.linkSet), set(self.built.linkSet))
+        for attribute in Link.arrayAttributes:
+            with self.subTest(attribute=attribute):
+                for l, link in self.built.linkSet.items():
+                    self.assertAlmostEqual(getattr(self.loaded.linkSet[l], attribute), getattr(link, attribute),
+                                           delta=1e-6, msg=str(l))
+
+    def test_demand(self):
+        # OD pairs without demand may be missing from one of the networks
+        for od in set(self.loaded.tripSet) | set(self.built.tripSet):
+            loadedTrip = self.loaded.tripSet.get(od)
+            builtTrip = self.built.tripSet.get(od)
+            with self.subTest(od=od):
+                self.assertAlmostEqual(loadedTrip.demand if loadedTrip else 0.0,
+                                       builtTrip.demand if builtTrip else 0.0, delta=1e-6)
+                self.assertAlmostEqual(loadedTrip.demand2 if loadedTrip else 0.0,
+                                       builtTrip.demand2 if builtTrip else 0.0, delta=1e-6)
+
+    def test_assignment(self):
+        TSTTs = [assignment_loop(network=network, accuracy=0.0001, maxIter=1000, maxTime=10 ** 6, verbose=False)
+                 for network in (self.built, self.loaded)]
+        self.assertAlmostEqual(TSTTs[0], TSTTs[1], delta=1e-6 * TSTTs[0])
+
+    def test_bundled_name(self):
+        with self.assertRaises(ValueError):
+            writeTNTP(self.net_df, self.demand_df, "SiouxFalls", self.folder.name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,11 +17,23 @@ def import_network(network_file: str, demand_file: str, force_reprocess: bool =
     :return: None
     """
 
-    network_file_csv = network_file.split(".")[0].split("/")[-1] + ".csv"
-    demand_file_csv = demand_file.split(".")[0].split("/")[-1] + ".csv"
+    net_df = import_net(network_file, force_reprocess=force_reprocess)
+    demand_df = import_demand(demand_file, force_reprocess=force_reprocess)
+
+    return net_df, demand_df
+
+
+def import_net(network_file: str, force_reprocess: bool = False):
+    """
+    This method imports only the network from its tntp file, storing it in the processed format as import_network does
 
+    :param network_file: network (net) file name
+    :param force_reprocess: True if the network should be reprocessed from the tntp file
+    :return: the network table
+    """
+
+    network_file_csv = network_file.split(".")[0].split("/")[-1] + ".csv"
     network_file_csv = PathUtils.processed_networks_folder / network_file_csv
-    demand_file_csv = PathUtils.processed_networks_folder / demand_file_csv
 
     if network_file_csv.is_file() and not force_reprocess:
         net_df = pd.read_csv(str(network_file_csv),
@@ -32,18 +44,28 @@ def import_network(network_file: str, demand_file: str, force_reprocess: bool =
                       sep='\t',
                       index=False)
 
+    return net_df
+
+
+def import_demand(demand_file: str, force_reprocess: bool = False):
+    """
+    This method imports only the demand from its tntp file, storing it in the processed format as import_network does
+
+    :param demand_file: demand (trips) file name
+    :param force_reprocess: True if the demand should be reprocessed from the tntp file
+    :return: the demand table
+    """
+
+    demand_file_csv = demand_file.split(".")[0].split("/")[-1] + ".csv"
+    demand_file_csv = PathUtils.processed_networks_folder / demand_file_csv
+
     if demand_file_csv.is_file() and not force_reprocess:
         demand_df = pd.read_csv(str(demand_file_csv),
                                 sep='\t')
     else:
         tripSet = _demand_file2trips(demand_file)
-        demand_df = pd.DataFrame(columns=["init_node", "term_node", "demand"])
-
-        k = 0
-        for orig in tripSet:
-            for dest in tripSet[orig]:
-                demand_df.loc[k] = [orig, dest, tripSet[orig][dest]]
-                k += 1
+        demand_df = pd.DataFrame([[orig, dest, tripSet[orig][dest]] for orig in tripSet for dest in tripSet[orig]],
+                                 columns=["init_node", "term_node", "demand"])
 
         demand_df = demand_df.astype({"init_node": int, "term_node": int})
 
@@ -51,7 +73,7 @@ def import_network(network_file: str, demand_file: str, force_reprocess: bool =
                          sep='\t',
                          index=False)
 
-    return net_df, demand_df
+    return demand_df
 
 
 def _net_file2df(network_file: str):
@@ -0,0 +1,281 @@
+import math
+import time
+import warnings
+
+from assignment import *
+from utils import PathUtils
+
+
+def marginalCostTolls(network: FlowTransportNetwork, costFunction=BPRcostFunction) -> list:
+    """
+    Marginal cost tolls at the current link flows: the increase of the total system travel time (TSTT, weighted
+    with the values of time of the classes) caused by one more vehicle on the link, (vot1 * x1 + vot2 * x2) * t'(x).
+    Both user classes pay the same toll, which is in the generalized cost units of the assignment.
+
+    :return: list with the dict link -> toll of each user class
+    """
+    # x * t'(x) is the difference between the system optimal and the user cost of the link
+    flow = network.link_column("flow")
+    delay = (linkTravelTimes(network, flow, optimal=True, costFunction=costFunction) -
+             linkTravelTimes(network, flow, optimal=False, costFunction=costFunction))
+
+    classParameters = getClassParameters()
+    averageVot = np.divide(classParameters["vot1"] * network.link_column("flow1") +
+                           classParameters["vot2"] * network.link_column("flow2"),
+                           flow, out=np.zeros(len(flow)), where=flow > 0)
+    tolls = dict(zip(network.linkSet, averageVot * delay))
+    return [tolls, dict(tolls)]
+
+
+def setTolls(network: FlowTransportNetwork, tolls: list = None):
+    """
+    Sets the tolls paid by the user classes, on top of the tolls of the network file
+
+    :param tolls: list with the dict link -> additional toll of each user class,
+           None to keep only the tolls of the network file
+    """
+    for l, link in network.linkSet.items():
+        link.toll1 = link.toll + (tolls[0].get(l, 0.0) if tolls else 0.0)
+        link.toll2 = link.toll + (tolls[1].get(l, 0.0) if tolls else 0.0)
+
+
+class PricingStudy:
+    """
+    Compares congestion pricing scenarios on a network loaded once, at the current values of time.
+
+    The user equilibrium without distance prices and tolls is solved when the study is created and every scenario
+    reports its total system travel time (TSTT, without prices and tolls) and its reduction from this equilibrium,
+    together with the price and toll revenue. The solutions of all the scenarios are kept: a scenario is warm started
+    from the solved scenario of the same kind with the closest prices, and a scenario that was already solved is not
+    solved again.
+
+    The kinds of scenarios are:
+        - "UE": user equilibrium with distance prices (price1, price2)
+        - "SO": system optimum of assignment_loop
+        - "tolled UE": user equilibrium with marginal cost tolls
+    """
+
+    def __init__(self,
+                 network: FlowTransportNetwork,
+                 algorithm: str = "FW",
+                 costFunction=BPRcostFunction,
+                 accuracy: float = 0.0001,
+                 maxIter: int = 1000,
+                 maxTime: int = 60,
+                 verbose: bool = True):
+        """
+        Parameters are as in computeAssingment
+        """
+        self.network = network
+        self.costFunction = costFunction
+        self.settings = dict(algorithm=algorithm, costFunction=costFunction, accuracy=accuracy,
+                             maxIter=maxIter, maxTime=maxTime)
+        self.verbose = verbose
+
+        self.baseParameters = getClassParameters()
+        self.solutions = {}  # scenario name -> dict with the kind, prices, flows and result of the scenario
+        self.results = []
+        self.tolls = None
+
+        self.baseTSTT = None
+        self.baseTSTT = self._solve("no pricing", "UE", (0.0, 0.0))["TSTT"]
+
+    def _closestSolution(self, kind: str, prices: tuple) -> str:
+        candidates = [name for name, solution in self.solutions.items() if solution["kind"] == kind]
+        if not candidates:
+            candidates = [name for name, solution in self.solutions.items() if solution["kind"] == "UE"]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda name: (self.solutions[name]["prices"][0] - prices[0]) ** 2 +
+                                                (self.solutions[name]["prices"][1] - prices[1]) ** 2)
+
+    def _assign(self, kind: str, prices: tuple, tolls: list = None, seedFlows: dict = None, minIter: int = 0,
+                accuracy: float = None) -> tuple:
+        """
+        Solves the assignment of a scenario, warm started from seedFlows if given, leaving its flows on the network
+
+        :param minIter: Minimum number of flow updates, as in assignment_loop
+        :param accuracy: Relative gap replacing the accuracy of the study
+        :return: TSTT, price and toll revenue, number of iterations and whether the relative gap reached the accuracy
+        """
+        network = self.network
+        history = []
+        settings = self.settings if accuracy is None else dict(self.settings, accuracy=accuracy)
+        setClassParameters(price_1=prices[0], price_2=prices[1])
+        setTolls(network, tolls)
+        try:
+            if seedFlows is not None:
+                network.set_flows(seedFlows)
+            TSTT = assignment_loop(network=network,
+                                   systemOptimal=kind == "SO",
+                                   verbose=False,
+                                   warmStart=seedFlows is not None,
+                                   convergenceHistory=history,
+                                   minIter=minIter,
+                                   **settings)
+            length = network.link_column("length")
+            revenue = float(np.sum(network.link_column("flow1") * (prices[0] * length + network.link_column("toll1")) +
+                                   network.link_column("flow2") * (prices[1] * length + network.link_column("toll2"))))
+        finally:
+            setClassParameters(price_1=self.baseParameters["price1"], price_2=self.baseParameters["price2"])
+            setTolls(network)
+        converged = bool(history) and history[-1][RelativeGap.name] <= settings["accuracy"]
+        return TSTT, revenue, history[-1]["iteration"] if history else 0, converged
+
+    def _record(self, name: str, kind: str, prices: tuple, TSTT: float, revenue: float, iterations: int,
+                converged: bool, seed: str, startTime: float) -> dict:
+        baseTSTT = TSTT if self.baseTSTT is None else self.baseTSTT
+        result = {"scenario": name,
+                  "kind": kind,
+                  "price1": prices[0],
+                  "price2": prices[1],
+                  "TSTT": TSTT,
+                  "TSTT reduction": round(baseTSTT - TSTT, 2),
+                  "TSTT reduction (%)": round(100 * (baseTSTT - TSTT) / baseTSTT, 3) if baseTSTT else 0.0,
+                  "revenue": round(revenue, 2),
+                  "iterations": iterations,
+                  "converged": converged,
+                  "warm start": seed,
+                  "time": round(time.time() - startTime, 3)}
+        self.solutions[name] = {"kind": kind, "prices": prices, "flows": self.network.get_flows(), "result": result}
+        self.results.append(result)
+        if self.verbose:
+            print(f"{name}: TSTT {TSTT} ({result['TSTT reduction (%)']}% reduction), "
+                  f"{iterations} iterations", f"from {seed}" if seed else "from zero flow",
+                  "" if converged else "(not converged)")
+        return result
+
+    def _solve(self, name: str, kind: str, prices: tuple, tolls: list = None) -> dict:
+        if name in self.solutions:
+            return self.solutions[name]["result"]
+        seed = self._closestSolution(kind, prices)
+        startTime = time.time()
+        TSTT, revenue, iterations, converged = self._assign(kind, prices, tolls=tolls,
+                                                            seedFlows=self.solutions[seed]["flows"] if seed else None)
+        return self._record(name, kind, prices, TSTT, revenue, iterations, converged, seed, startTime)
+
+    def marginalCostPricing(self, maxTollIterations: int = 20, tollTolerance: float = 0.01) -> dict:
+        """
+        Solves the user equilibrium with marginal cost tolls (stored in self.tolls), without distance prices.
+
+        The tolls are first computed at the system optimal flows, then the tolled user equilibrium is solved and
+        the tolls are moved towards the marginal cost tolls of its flows, every equilibrium warm started from the
+        previous one, until the relative change of the tolls is at most tollTolerance. The toll steps are
+        self-regulating averages (as SelfRegulatingAverage in step_size.py): the step is 1 / beta, beta starts at 2
+        and grows by 1.5 when the relative change of the tolls grew and by 0.25 otherwise.
+        Every equilibrium does at least one flow update, since the warm start flows can meet the accuracy before
+        they respond to the new tolls, and is solved to a relative gap of at most 1% of the latest relative change
+        of the tolls, so that the error of the flows does not keep the change of the tolls above tollTolerance.
+        At convergence the tolled user equilibrium minimizes the TSTT.
+
+        :return: the result of the tolled user equilibrium, its iterations are those of all the toll iterations and
+                 "converged" is False, with a warning, if the tolls did not settle within maxTollIterations
+        """
+        prices = (0.0, 0.0)
+        self._solve("system optimum", "SO", prices)
+        if "marginal cost tolls" in self.solutions:
+            return self.solutions["marginal cost tolls"]["result"]
+
+        startTime = time.time()
+        flows = self.solutions["system optimum"]["flows"]
+        self.network.set_flows(flows)
+        tolls = marginalCostTolls(self.network, costFunction=self.costFunction)
+        iterations = 0
+        tollsSettled = False
+        accuracy = self.settings["accuracy"]
+        beta = 2.0
+        previousChange = math.inf
+        for tollIteration in range(1, maxTollIterations + 1):
+            TSTT, revenue, assignmentIterations, converged = self._assign("tolled UE", prices, tolls=tolls,
+                                                                          seedFlows=flows, minIter=1,
+                                                                          accuracy=accuracy)
+            iterations += assignmentIterations
+            flows = self.network.get_flows()
+
+            newTolls = marginalCostTolls(self.network, costFunction=self.costFunction)
+            change = math.sqrt(sum((newTolls[c][l] - tolls[c][l]) ** 2 for c in (0, 1) for l in tolls[c]))
+            size = math.sqrt(sum(t ** 2 for c in (0, 1) for t in newTolls[c].values()))
+            relativeChange = change / size if size > 0 else (0.0 if change == 0 else math.inf)
+            if self.verbose:
+                print(f"Toll iteration {tollIteration}: TSTT {TSTT}, relative toll change", round(relativeChange, 5))
+            tollsSettled = relativeChange <= tollTolerance
+            if tollsSettled or tollIteration == maxTollIterations:
+                break
+            if tollIteration > 1:
+                beta += 1.5 if relativeChange >= previousChange else 0.25
+            previousChange = relativeChange
+            accuracy = min(accuracy, 0.01 * relativeChange)
+            tolls = [{l: t + (newTolls[c][l] - t) / beta for l, t in tolls[c].items()} for c in (0, 1)]
+
+        if not tollsSettled:
+            warnings.warn(f"The marginal cost tolls did not settle within {maxTollIterations} toll iterations, "
+                          f"relative toll change {round(relativeChange, 5)}")
+        self.tolls = tolls
+        return self._record("marginal cost tolls", "tolled UE", prices, TSTT, revenue, iterations,
+                            converged and tollsSettled, "system optimum", startTime)
+
+    def priceGrid(self, prices1: list, prices2: list) -> list:
+        """
+        Solves the user equilibrium for every combination of the distance prices of the two user classes.
+        The grid is visited row by row in alternating directions, so that every scenario can be warm started
+        from a neighbouring one
+
+        :return: the results of the scenarios of the grid
+        """
+        results = []
+        for i, p1 in enumerate(prices1):
+            for p2 in (prices2 if i % 2 == 0 else reversed(prices2)):
+                results.append(self._solve(f"price1={p1}, price2={p2}", "UE", (p1, p2)))
+        return results
+
+    def report(self) -> pd.DataFrame:
+        return pd.DataFrame(self.results).set_index("scenario")
+
+
+def pricingStudy(net_file: str,
+                 demand_file: str = None,
+                 prices1: list = None,
+                 prices2: list = None,
+                 marginalCost: bool = True,
+                 algorithm: str = "FW",
+                 costFunction=BPRcostFunction,
+                 accuracy: float = 0.0001,
+                 maxIter: int = 1000,
+                 maxTime: int = 60,
+                 force_net_reprocess: bool = False,
+                 verbose: bool = True
+                 ) -> pd.DataFrame:
+    """
+    Loads a network once and compares the user equilibrium without distance prices and tolls with the marginal
+    cost tolls and with a grid of distance prices of the two user classes
+
+    :param prices1: Distance prices of user class 1 of the grid, by default the current price
+    :param prices2: Distance prices of user class 2 of the grid, by default the current price
+    :param marginalCost: True to solve the user equilibrium with marginal cost tolls
+    :return: table with the TSTT, TSTT reduction, revenue and iterations of every scenario
+    Other parameters are as in computeAssingment
+    """
+    network = load_network(net_file=net_file, demand_file=demand_file, force_net_reprocess=force_net_reprocess,
+                           verbose=verbose)
+    study = PricingStudy(network, algorithm=algorithm, costFunction=costFunction, accuracy=accuracy,
+                         maxIter=maxIter, maxTime=maxTime, verbose=verbose)
+    if marginalCost:
+        study.marginalCostPricing()
+    if prices1 is not None or prices2 is not None:
+        study.priceGrid(prices1 if prices1 is not None else [study.baseParameters["price1"]],
+                        prices2 if prices2 is not None else [study.baseParameters["price2"]])
+
+    report = study.report()
+    if verbose:
+        print(report.to_string())
+    return report
+
+
+if __name__ == '__main__':
+
+    # Example on Sioux Falls: marginal cost tolls and a 3x3 grid of distance prices
+
+    pricingStudy(net_file=str(PathUtils.sioux_falls_net_file),
+                 prices1=[0.0, 0.1, 0.5],
+                 prices2=[0.0, 0.1, 0.5],
+                 accuracy=0.001)
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+from cost_functions import *
+
+resultColumns = ["init_node", "term_node", "flow1", "flow2", "travelTime", "cost1", "cost2"]
+
+
+def linkResultArrays(network, costFunction=BPRcostFunction) -> dict:
+    """
+    Collects the per class link flows and costs of a FlowTransportNetwork in arrays (one entry per link, in linkSet
+    order). travelTime is the link travel time at the max capacity, as in get_TSTT, while cost1 and cost2 are the
+    generalized costs of the two user classes used by the assignment.
+    """
+    column = network.link_column
+    results = {"init_node": np.array([link.init_node for link in network.linkSet.values()]),
+               "term_node": np.array([link.term_node for link in network.linkSet.values()]),
+               "flow1": column("flow1"),
+               "flow2": column("flow2"),
+               "cost1": column("cost1"),
+               "cost2": column("cost2")}
+    results["travelTime"] = costVector(costFunction, False, column("fft"), column("alpha"), column("flow"),
+                                       column("max_capacity"), column("beta"), column("length"),
+                                       column("speedLimit")).astype(float, copy=False)
+    return results
+
+
+def writeResultsTSV(results: dict, output_file: str, costFunction=BPRcostFunction, systemOptimal: bool = False):
+    """
+    Writes the link results of linkResultArrays, with the total system travel time under the key "TSTT",
+    in the tab separated "_flow.tntp" format, the per class costs are added as the last columns so readers of the previous format keep working
+    """
+    with open(output_file, "w", buffering=2 ** 20) as outFile:
+        outFile.write("Total Travel Time:\t" + str(results["TSTT"]) + "\n")
+        outFile.write("Cost function used:\t" + costFunction.__name__ + "\n")
+        outFile.write("User equilibrium (UE) or system optimal (SO):\t" + ("SO" if systemOptimal else "UE") + "\n\n")
+        pd.DataFrame({c: results[c] for c in resultColumns}).to_csv(outFile, sep="\t", index=False,
+                                                                    lineterminator="\n")
+
+
+def writeResultsBinary(results: dict, output_file: str, costFunction=BPRcostFunction, systemOptimal: bool = False,
+                       precision=np.float64):
+    """
+    Writes the link results of linkResultArrays, with the total system travel time under the key "TSTT",
+    in a compact columnar format: a compressed numpy archive (".npz")
+    or a parquet file (".parquet", requires pyarrow or fastparquet).
+    Numeric node ids are stored as integers and the flows and costs with the given precision.
+
+    :param precision: Floating point type of the flow and cost columns (np.float64 or np.float32)
+    """
+    columns = {}
+    for c in resultColumns:
+        if c in ("init_node", "term_node"):
+            columns[c] = results[c].astype(np.int64) if np.char.isdigit(results[c]).all() else results[c]
+        else:
+            columns[c] = results[c].astype(precision)
+
+    if output_file.endswith(".parquet"):
+        results_df = pd.DataFrame(columns)
+        results_df.attrs = {"TSTT": results["TSTT"],
+                            "costFunction": costFunction.__name__,
+                            "systemOptimal": systemOptimal}
+        results_df.to_parquet(output_file, index=False)
+    else:
+        np.savez_compressed(output_file,
+                            TSTT=np.array(results["TSTT"]),
+                            costFunction=np.array(costFunction.__name__),
+                            systemOptimal=np.array(systemOptimal),
+                            **columns)
+
+
+def readResultsBinary(input_file: str) -> dict:
+    """
+    Reads the link results written by writeResultsBinary
+    """
+    if input_file.endswith(".parquet"):
+        results_df = pd.read_parquet(input_file)
+        results = {c: results_df[c].to_numpy() for c in results_df.columns}
+        results.update(results_df.attrs)
+        return results
+    with np.load(input_file) as archive:
+        results = {key: archive[key] for key in archive.files}
+    for key in ("TSTT", "costFunction", "systemOptimal"):
+        results[key] = results[key].item()
+    return results
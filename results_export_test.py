@@ -0,0 +1,64 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+from assignment import *
+
+
+class ResultsRoundTripTest(unittest.TestCase):
+    """
+    The results files written by writeResults hold the link results of the solved network
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        cls.network = load_network(net_file=str(PathUtils.sioux_falls_net_file), verbose=False)
+        cls.TSTT = assignment_loop(network=cls.network, accuracy=0.01, maxIter=1000, maxTime=10 ** 6, verbose=False)
+        cls.results = linkResultArrays(cls.network)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.folder.cleanup()
+
+    def assertResultsEqual(self, results: dict, rtol: float):
+        np.testing.assert_array_equal(np.asarray(results["init_node"]).astype(str), self.results["init_node"])
+        np.testing.assert_array_equal(np.asarray(results["term_node"]).astype(str), self.results["term_node"])
+        for column in resultColumns[2:]:
+            with self.subTest(column=column):
+                np.testing.assert_allclose(results[column], self.results[column], rtol=rtol)
+
+    def test_tsv(self):
+        output_file = os.path.join(self.folder.name, "SiouxFalls_flow.tntp")
+        writeResults(self.network, output_file, verbose=False)
+        with open(output_file) as inFile:
+            self.assertEqual(float(inFile.readline().split("\t")[1]), self.TSTT)
+        results_df = pd.read_csv(output_file, sep="\t", skiprows=4)
+        self.assertEqual(list(results_df.columns), resultColumns)
+        self.assertResultsEqual({c: results_df[c].to_numpy() for c in resultColumns}, rtol=1e-12)
+
+    def _binaryRoundTrip(self, output_file: str, precision, rtol: float):
+        writeResults(self.network, output_file, systemOptimal=True, verbose=False, precision=precision)
+        results = readResultsBinary(output_file)
+        self.assertEqual(results["TSTT"], self.TSTT)
+        self.assertEqual(results["costFunction"], BPRcostFunction.__name__)
+        self.assertTrue(results["systemOptimal"])
+        self.assertEqual(results["flow1"].dtype, precision)
+        self.assertEqual(results["init_node"].dtype, np.int64)
+        self.assertResultsEqual(results, rtol=rtol)
+
+    def test_npz(self):
+        self._binaryRoundTrip(os.path.join(self.folder.name, "SiouxFalls_flow.npz"), np.float64, rtol=0)
+
+    def test_npz_single_precision(self):
+        self._binaryRoundTrip(os.path.join(self.folder.name, "SiouxFalls_flow32.npz"), np.float32, rtol=1e-6)
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow") or importlib.util.find_spec("fastparquet"),
+                         "requires pyarrow or fastparquet")
+    def test_parquet(self):
+        self._binaryRoundTrip(os.path.join(self.folder.name, "SiouxFalls_flow.parquet"), np.float64, rtol=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import heapq
+from collections import OrderedDict
+
+from assignment import *
+
+
+class RouteQueryCache:
+    """
+    Answers best route queries (route, generalized cost and travel time per user class) on a solved network.
+
+    Shortest path trees are cached per origin and user class, with least recently used eviction once the
+    trees take more than maxBytes, their labels (route costs) are stored in the precision of the network.
+    Single queries whose tree is not cached are answered with a bidirectional Dijkstra search instead of a full
+    tree (the nodes have no coordinates for a goal-directed A* heuristic), batched queries compute and cache one
+    tree per origin and user class.
+
+    The routes are computed with the link costs stored on the network (cost1, cost2): call clear() whenever
+    the flows or the costs of the network change.
+    """
+
+    def __init__(self, network: FlowTransportNetwork, costFunction=BPRcostFunction, maxBytes: int = 64 * 2 ** 20):
+        """
+        :param costFunction: Cost function used to compute the travel time of the routes
+        :param maxBytes: Memory bound of the cached trees
+        """
+        self.network = network
+        self.costFunction = costFunction
+        self.maxBytes = maxBytes
+
+        self._nodes = list(network.nodeSet)
+        self._nodeIndex = {node: i for i, node in enumerate(self._nodes)}
+        self._trees = OrderedDict()  # (origin, user_class) -> (labels, preds)
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self._trees.clear()
+        self._bytes = 0
+
+    def _tree(self, origin: str, user_class: int):
+        key = (origin, user_class)
+        if key in self._trees:
+            self.hits += 1
+            self._trees.move_to_end(key)
+            return self._trees[key]
+
+        self.misses += 1
+        DijkstraHeap(origin, network=self.network, user_class=user_class)
+        nodeSet = self.network.nodeSet
+        labels = np.fromiter((nodeSet[n].label for n in self._nodes), dtype=self.network.precision,
+                             count=len(self._nodes))
+        preds = np.fromiter((-1 if nodeSet[n].pred is None else self._nodeIndex[nodeSet[n].pred]
+                             for n in self._nodes), dtype=np.int32, count=len(self._nodes))
+
+        self._trees[key] = (labels, preds)
+        self._bytes += labels.nbytes + preds.nbytes
+        while self._bytes > self.maxBytes and len(self._trees) > 1:
+            _, (evictedLabels, evictedPreds) = self._trees.popitem(last=False)
+            self._bytes -= evictedLabels.nbytes + evictedPreds.nbytes
+        return labels, preds
+
+    def _treeRoute(self, labels: np.ndarray, preds: np.ndarray, destination: str):
+        destinationIndex = self._nodeIndex[destination]
+        if labels[destinationIndex] == np.inf:
+            return np.inf, []
+        path = [destinationIndex]
+        while preds[path[-1]] >= 0:
+            path.append(preds[path[-1]])
+        return float(labels[destinationIndex]), [self._nodes[i] for i in reversed(path)]
+
+    def _bidirectionalRoute(self, origin: str, destination: str, user_class: int):
+        if origin == destination:
+            return 0.0, [origin]
+        linkSet = self.network.linkSet
+        nodeSet = self.network.nodeSet
+        costAttribute = "cost1" if user_class == 1 else "cost2"
+
+        # Index 0 searches forward from the origin, index 1 backward from the destination
+        labels = [{origin: 0.0}, {destination: 0.0}]
+        preds = [{origin: None}, {destination: None}]
+        heaps = [[(0.0, origin)], [(0.0, destination)]]
+        settled = [set(), set()]
+        best = np.inf
+        meetingNode = None
+
+        while heaps[0] and heaps[1] and heaps[0][0][0] + heaps[1][0][0] < best:
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            label, currentNode = heapq.heappop(heaps[side])
+            if currentNode in settled[side]:
+                continue
+            settled[side].add(currentNode)
+
+            neighbours = nodeSet[currentNode].outLinks if side == 0 else nodeSet[currentNode].inLinks
+            for neighbour in neighbours:
+                link = (currentNode, neighbour) if side == 0 else (neighbour, currentNode)
+                newLabel = label + getattr(linkSet[link], costAttribute)
+                if newLabel < labels[side].get(neighbour, np.inf):
+                    labels[side][neighbour] = newLabel
+                    preds[side][neighbour] = currentNode
+                    heapq.heappush(heaps[side], (newLabel, neighbour))
+                if neighbour in labels[1 - side] and labels[side][neighbour] + labels[1 - side][neighbour] < best:
+                    best = labels[side][neighbour] + labels[1 - side][neighbour]
+                    meetingNode = neighbour
+
+        if meetingNode is None:
+            return np.inf, []
+        path = [meetingNode]
+        while preds[0][path[0]] is not None:
+            path.insert(0, preds[0][path[0]])
+        while preds[1][path[-1]] is not None:
+            path.append(preds[1][path[-1]])
+        return best, path
+
+    def _result(self, origin: str, destination: str, user_class: int, cost: float, path: list) -> dict:
+        travelTime = 0.0
+        for link in zip(path[:-1], path[1:]):
+            link = self.network.linkSet[link]
+            # At the max capacity, as the travel times of get_TSTT and of the results files
+            travelTime += self.costFunction(False, link.fft, link.alpha, link.flow, link.max_capacity, link.beta,
+                                            link.length, link.speedLimit)
+        return {"origin": origin,
+                "destination": destination,
+                "user_class": user_class,
+                "cost": cost,
+                "travelTime": travelTime if path else np.inf,
+                "nodes": path}
+
+    def route(self, origin: str, destination: str, user_class: int = 1) -> dict:
+        """
+        Best route of a user class between two nodes
+
+        :return: dict with the generalized "cost" of the route, its "travelTime" and its "nodes"
+                 (cost and travel time are inf and nodes is empty if the destination cannot be reached)
+        """
+        if (origin, user_class) in self._trees:
+            cost, path = self._treeRoute(*self._tree(origin, user_class), destination)
+        else:
+            cost, path = self._bidirectionalRoute(origin, destination, user_class)
+        return self._result(origin, destination, user_class, cost, path)
+
+    def routes(self, queries: list) -> list:
+        """
+        Answers a batch of queries (origin, destination, user_class) with one shortest path tree
+        per origin and user class
+
+        :return: the results of the queries, in the same order, as returned by route()
+        """
+        results = [None] * len(queries)
+        byOrigin = {}
+        for k, (origin, destination, user_class) in enumerate(queries):
+            byOrigin.setdefault((origin, user_class), []).append((k, destination))
+
+        for (origin, user_class), destinations in byOrigin.items():
+            labels, preds = self._tree(origin, user_class)
+            for k, destination in destinations:
+                cost, path = self._treeRoute(labels, preds, destination)
+                results[k] = self._result(origin, destination, user_class, cost, path)
+        return results
@@ -0,0 +1,51 @@
+import unittest
+
+from route_queries import *
+
+
+class RouteQueryCacheTest(unittest.TestCase):
+    """
+    Single route queries (bidirectional Dijkstra) agree with the batched queries (cached shortest path trees)
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.network = load_network(net_file=str(PathUtils.sioux_falls_net_file), verbose=False)
+        assignment_loop(network=cls.network, accuracy=0.01, maxIter=1000, maxTime=10 ** 6, verbose=False)
+        nodes = sorted(cls.network.nodeSet, key=int)
+        cls.queries = [(origin, destination, user_class) for origin in nodes[::3] for destination in nodes
+                       for user_class in (1, 2)]
+
+    def assertRouteConsistent(self, result: dict):
+        # The cost of a route is the sum of the costs of its links
+        costAttribute = f"cost{result['user_class']}"
+        links = list(zip(result["nodes"][:-1], result["nodes"][1:]))
+        self.assertEqual(result["nodes"][0], result["origin"])
+        self.assertEqual(result["nodes"][-1], result["destination"])
+        self.assertAlmostEqual(sum(getattr(self.network.linkSet[l], costAttribute) for l in links), result["cost"],
+                               delta=1e-9 * max(1.0, result["cost"]))
+
+    def test_route_matches_routes(self):
+        singleResults = [RouteQueryCache(self.network).route(*query) for query in self.queries]
+        batchResults = RouteQueryCache(self.network).routes(self.queries)
+        for query, single, batch in zip(self.queries, singleResults, batchResults):
+            with self.subTest(query=query):
+                self.assertRouteConsistent(single)
+                self.assertRouteConsistent(batch)
+                self.assertAlmostEqual(single["cost"], batch["cost"], delta=1e-9 * max(1.0, batch["cost"]))
+                if single["nodes"] == batch["nodes"]:
+                    self.assertEqual(single["travelTime"], batch["travelTime"])
+
+    def test_cached_route(self):
+        cache = RouteQueryCache(self.network)
+        batchResults = cache.routes(self.queries)
+        misses = cache.misses
+        for query, batch in zip(self.queries, batchResults):
+            with self.subTest(query=query):
+                self.assertEqual(cache.route(*query), batch)
+        # Every origin already has its tree
+        self.assertEqual(cache.misses, misses)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import math
+from abc import ABC, abstractmethod
+
+import scipy.optimize
+
+
+def exactStep(derivative) -> float:
+    """
+    Root in [0, 1] of the derivative of the line search objective along the direction (exact line search),
+    or the interval end where the objective is minimal if the derivative does not change sign.
+    0 means that the direction does not decrease the objective
+    """
+    endDerivative = derivative(1)
+    if endDerivative <= 0:
+        return 1.0
+    startDerivative = derivative(0)
+    if startDerivative >= 0:
+        return 0.0
+    # The root search starts by evaluating the interval ends, which are already known
+    known = {0.0: startDerivative, 1.0: endDerivative}
+    root = scipy.optimize.brentq(lambda alpha: known[alpha] if alpha in known else derivative(alpha), 0.0, 1.0)
+    assert 0 <= root <= 1
+    return root
+
+
+class StepSizePolicy(ABC):
+    """
+    Base class of the step size rules of assignment_loop, usable with any direction (auxiliary flows x_bar).
+
+    step() receives:
+        - stepNumber: number of solutions averaged after the step (1 for the first step from zero flow)
+        - derivative: function of the step size alpha in [0, 1] returning the derivative of the line search objective,
+          sum over links and classes of (x_bar - x) * cost(x + alpha * (x_bar - x)).
+          Every call costs a cost function evaluation per link and is counted in self.evaluations
+        - x_bar: the auxiliary flows of the two user classes
+        - network: the network, holding the current link flows
+    """
+    name = "step size"
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.evaluations = 0
+        self.alpha = None
+
+    def _counted(self, derivative):
+        def countedDerivative(alpha):
+            self.evaluations += 1
+            return derivative(alpha)
+
+        return countedDerivative
+
+    def step(self, stepNumber: int, derivative, x_bar: list, network) -> float:
+        self.alpha = self.compute(stepNumber, self._counted(derivative), x_bar, network)
+        return self.alpha
+
+    @abstractmethod
+    def compute(self, stepNumber: int, derivative, x_bar: list, network) -> float:
+        pass
+
+
+class ExactLineSearch(StepSizePolicy):
+    """
+    Frank-Wolfe step: exact line search solving derivative(alpha) = 0
+    """
+    name = "exact line search"
+
+    def compute(self, stepNumber: int, derivative, x_bar: list, network) -> float:
+        return exactStep(derivative)
+
+
+class MSAStep(StepSizePolicy):
+    """
+    Method of successive averages: alpha = 1 / stepNumber
+    """
+    name = "MSA"
+
+    def compute(self, stepNumber: int, derivative, x_bar: list, network) -> float:
+        return 1 / stepNumber
+
+
+class PredeterminedStep(StepSizePolicy):
+    """
+    Predetermined step sizes, alpha = scale / (stepNumber + shift) ** power by default
+    (power in (0.5, 1] gives larger steps than MSA), or given by a function of stepNumber
+    or a list of step sizes. The first step of a cold start is always 1 (the all-or-nothing flows) and does not
+    use the policy, so the list gives the steps computed by the policy: schedule[0] is used by the first call
+    (stepNumber 2), schedule[1] by the second and so on, the last value is kept when the list is exhausted.
+    """
+    name = "predetermined"
+
+    def __init__(self, schedule=None, scale: float = 1.0, shift: float = 0.0, power: float = 1.0):
+        self.schedule = schedule
+        self.scale = scale
+        self.shift = shift
+        self.power = power
+        super().__init__()
+
+    def reset(self):
+        super().reset()
+        self._calls = 0
+
+    def compute(self, stepNumber: int, derivative, x_bar: list, network) -> float:
+        if self.schedule is None:
+            alpha = self.scale / (stepNumber + self.shift) ** self.power
+        elif callable(self.schedule):
+            alpha = self.schedule(stepNumber)
+        else:
+            alpha = self.schedule[min(self._calls, len(self.schedule) - 1)]
+        self._calls += 1
+        return min(1.0, max(0.0, alpha))
+
+
+class SelfRegulatingAverage(StepSizePolicy):
+    """
+    Self-regulating averaging (Liu, Ban, Ran and Mirchandani, 2009): alpha = 1 / beta, where beta grows by
+    largeIncrement when the distance |x_bar - x| between the auxiliary and the current flows grew since
+    the previous step, and by smallIncrement otherwise. The step size stays large while the flows improve
+    and shrinks fast when they oscillate, without evaluating the cost functions.
+    """
+    name = "self-regulating average"
+
+    def __init__(self, largeIncrement: float = 1.5, smallIncrement: float = 0.25):
+        assert largeIncrement >= 1 > smallIncrement > 0
+        self.largeIncrement = largeIncrement
+        self.smallIncrement = smallIncrement
+        super().__init__()
+
+    def reset(self):
+        super().reset()
+        self._beta = None
+        self._previousDistance = math.inf
+
+    def compute(self, stepNumber: int, derivative, x_bar: list, network) -> float:
+        distance = math.sqrt(sum((x_bar[0][l] - link.flow1) ** 2 + (x_bar[1][l] - link.flow2) ** 2
+                                 for l, link in network.linkSet.items()))
+        if self._beta is None:
+            self._beta = float(stepNumber)
+        elif distance >= self._previousDistance:
+            self._beta += self.largeIncrement
+        else:
+            self._beta += self.smallIncrement
+        self._previousDistance = distance
+        return 1 / self._beta
+
+
+class ArmijoStep(StepSizePolicy):
+    """
+    Armijo backtracking: starting from min(1, expansion * previous alpha), the step size is multiplied by backtrack
+    until it gives the sufficient decrease of the line search objective
+        objective(alpha) - objective(0) <= sufficiency * alpha * derivative(0).
+    The objective is not evaluated directly, its decrease is the integral of the derivative over [0, alpha],
+    computed with the trapezoid rule from derivative(0) and derivative(alpha). The rule is exact when the derivative
+    is linear in alpha (quadratic approximation of the objective) and a close approximation for the small steps of
+    the later iterations. It usually needs two or three evaluations of the derivative instead of the full root
+    search of the exact line search.
+
+    The step is 0 when the direction does not decrease the objective or when no step size is accepted
+    within maxBacktracks reductions.
+    """
+    name = "Armijo"
+
+    def __init__(self, sufficiency: float = 0.1, backtrack: float = 0.5, expansion: float = 2.0,
+                 maxBacktracks: int = 20):
+        assert 0 < sufficiency < 0.5 and 0 < backtrack < 1 and expansion >= 1
+        self.sufficiency = sufficiency
+        self.backtrack = backtrack
+        self.expansion = expansion
+        self.maxBacktracks = maxBacktracks
+        super().__init__()
+
+    def compute(self, stepNumber: int, derivative, x_bar: list, network) -> float:
+        initialDerivative = derivative(0)
+        if initialDerivative >= 0:
+            # x_bar is not a descent direction, the current flows are already optimal along it
+            return 0.0
+        alpha = 1.0 if self.alpha is None or self.alpha <= 0 else min(1.0, self.expansion * self.alpha)
+        for _ in range(self.maxBacktracks + 1):
+            decrease = alpha * (initialDerivative + derivative(alpha)) / 2
+            if decrease <= self.sufficiency * alpha * initialDerivative:
+                return alpha
+            alpha *= self.backtrack
+        return 0.0